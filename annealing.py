@@ -0,0 +1,85 @@
+import math
+from metagrammar import Metagrammar
+from optimizer import Optimizer
+
+
+class AnnealingOptimizer(Optimizer):
+    """
+    An AnnealingOptimizer runs simulated annealing in batches: each batch is made of
+    neighbors of the current candidate, each with num_flips random entries flipped, and
+    the search moves to the best of them if it is better than the current candidate, or
+    otherwise with probability exp(-delta / temperature) where delta is how much worse it
+    is relative to the score of the current candidate (e.g. 0.1 for 10% worse).
+
+    The temperature follows the progress of run (see Optimizer.get_progress): it decays
+    geometrically from initial_temperature to final_temperature as the budget of solver
+    seconds, or the max_batches batches without a budget, are spent, so the search
+    explores early and settles on the best region whatever the length of the run.
+    """
+
+    def __init__(
+        self,
+        metagrammar: Metagrammar,
+        problem_dir: str,
+        problems: list,
+        num_flips: int = 2,
+        initial_temperature: float = 0.1,
+        final_temperature: float = 0.001,
+        **kwargs,
+    ):
+        """
+        Creates an AnnealingOptimizer starting from the current active rules of
+        metagrammar. See Optimizer for the other arguments.
+        """
+        super().__init__(metagrammar, problem_dir, problems, **kwargs)
+        self.num_flips = num_flips
+        self.initial_temperature = initial_temperature
+        self.final_temperature = final_temperature
+
+        # Current candidate and its (score, num_unsolved, num_solved), None until scored
+        self.current = self.copy_candidate(metagrammar.get_candidate())
+        self.current_result = None
+
+
+    def get_temperature(self) -> float:
+        """
+        Gets the temperature for the fraction of the budget spent so far
+        """
+        ratio = self.final_temperature / self.initial_temperature
+        return self.initial_temperature * ratio ** self.get_progress()
+
+
+    def ask(self, n: int) -> list:
+        ret = [] if self.current_result is not None else [self.current]
+        return ret + [self.neighbor(self.current, self.num_flips) for _ in range(n - len(ret))]
+
+
+    def tell(
+        self,
+        candidates: list,
+        results: list,
+    ):
+        super().tell(candidates, results)
+        for candidate, result in zip(candidates, results):
+            if self.current_result is None and candidate is self.current:
+                self.current_result = result
+
+        candidate, result = min(zip(candidates, results), key=lambda x: self.get_key(x[1]))
+        if self.get_key(result) <= self.get_key(self.current_result):
+            self.current, self.current_result = candidate, result
+            return
+        delta = (result[0] - self.current_result[0]) / max(self.current_result[0], 1)
+        if self.rng.random() < math.exp(-delta / self.get_temperature()):
+            print("[DEBUG] Accepted worse candidate: ", self.current_result[0], " -> ", result[0])
+            self.current, self.current_result = candidate, result
+
+
+    def run(
+        self,
+        budget: float = None,
+        max_batches: int = None,
+        max_idle_batches: int = 100,
+    ) -> list:
+        if budget is None and max_batches is None:
+            raise ValueError("Annealing needs a budget or max_batches to schedule its temperature")
+        return super().run(budget, max_batches, max_idle_batches)
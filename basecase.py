@@ -8,6 +8,7 @@ from sexp_utils import *
 from metagrammar import Metagrammar
 from sygusproblem import SyGuSProblem
 from rule import Rule
+from rulespec import load_rule
 
 
 """
@@ -24,48 +25,11 @@ if __name__ == "__main__":
     # p.read_sygus_problem("benchmarks/lib/General_Track/bv-conditional-inverses/", "find_inv_bvsge_bvadd_4bit.sl")
     # print(p)
 
-    # Change to BitVec of all types
-    r = Rule("BitVec", [create_symbol("_"), create_symbol("BitVec"), 4], lambda x: create_symbol("#x0"))
-    r.add_subrule(lambda x: [create_symbol("BitVec0")])
-    r.add_subrule(lambda x: [create_symbol("BitVec1")])
-    r.add_subrule(lambda x: [create_symbol("BitVec2")])
-
-    combinations1 = [
-        [Symbol("BitVec0"),
-         Symbol("BitVec1"),
-         Symbol("BitVec2")]
-    ]
-
-    combinations2 = [
-        [Symbol("BitVec0"), Symbol("BitVec0")],
-        [Symbol("BitVec0"), Symbol("BitVec1")],
-        [Symbol("BitVec0"), Symbol("BitVec2")],
-        [Symbol("BitVec1"), Symbol("BitVec0")],
-        [Symbol("BitVec1"), Symbol("BitVec1")],
-        [Symbol("BitVec1"), Symbol("BitVec2")],
-        [Symbol("BitVec2"), Symbol("BitVec0")],
-        [Symbol("BitVec2"), Symbol("BitVec1")],
-        [Symbol("BitVec2"), Symbol("BitVec2")]
-    ]
-    for a in combinations1:
-        r.add_subrule(lambda x: [[Symbol("bvneg"), a]])
-        r.add_subrule(lambda x: [[Symbol("bvnot"), a]])
-
-    for a, b in combinations2:
-        r.add_subrule(lambda x: [[Symbol("bvadd"), a, b]])
-        r.add_subrule(lambda x: [[Symbol("bvsub"), a, b]])
-        r.add_subrule(lambda x: [[Symbol("bvand"), a, b]])
-        r.add_subrule(lambda x: [[Symbol("bvadd"), a, b]])
-        r.add_subrule(lambda x: [[Symbol("bvlshr"), a, b]])
-        r.add_subrule(lambda x: [[Symbol("bvor"), a, b]])
-        r.add_subrule(lambda x: [[Symbol("bvshl"), a, b]])
-
-
-    r.add_subrule(lambda x: [create_symbol(c) for c in x.get_constants()])
-    r.add_subrule(lambda x: [create_symbol(v) for v in x.get_variables()])
+    # Change to BitVec of all types, see rulespec.py for the format of the rule
+    r = load_rule("rules/bitvec.json")
 
     # Set up metagrammar and add the generated bitvector rules
-    best_str = "0" * 210
+    best_str = "0" * r.get_length()
     best_score = float("inf")
     best_unsolved = float("inf")
     best_solved = 0
@@ -0,0 +1,197 @@
+import math
+import numpy as np
+from metagrammar import Metagrammar
+from optimizer import Optimizer
+from solveroptions import SOLVER_OPTIONS
+
+
+class BayesianOptimizer(Optimizer):
+    """
+    A BayesianOptimizer models the score of candidates with a Gaussian process and asks
+    for the candidates with the highest expected improvement over the best score so far.
+
+    A candidate is encoded as a bitstring: the entries of its active rules followed by a
+    one-hot encoding of its solver options (see SOLVER_OPTIONS). The kernel between two
+    bitstrings x and y is exp(-lengthscale * hamming(x, y) / len(x)), and the lengthscale
+    is picked among LENGTHSCALES by marginal likelihood each time the model is fit. The
+    model is fit to the standardized log of the scores.
+
+    The first num_initial candidates are the starting candidate and random ones. After
+    that, expected improvement is maximized over num_proposals unscored candidates: random
+    ones and neighbors (1 to max_flips entries flipped) of the best candidates so far. A
+    batch is filled greedily, adding each picked candidate to the model with its predicted
+    score (kriging believer) before picking the next one.
+    """
+
+    LENGTHSCALES = [0.5, 1, 2, 4, 8, 16, 32]
+
+    def __init__(
+        self,
+        metagrammar: Metagrammar,
+        problem_dir: str,
+        problems: list,
+        num_initial: int = 8,
+        num_proposals: int = 256,
+        max_flips: int = 3,
+        num_parents: int = 5,
+        noise: float = 1e-3,
+        **kwargs,
+    ):
+        """
+        Creates a BayesianOptimizer starting from the current active rules of metagrammar.
+        Neighbors are drawn around the num_parents best candidates, and noise is the
+        variance of the noise of the standardized scores. See Optimizer for the other
+        arguments.
+        """
+        super().__init__(metagrammar, problem_dir, problems, **kwargs)
+        self.num_initial = num_initial
+        self.num_proposals = num_proposals
+        self.max_flips = max_flips
+        self.num_parents = num_parents
+        self.noise = noise
+        self.lengthscale = 1
+
+        # Scored candidates, their canonical hashes, encodings and scores
+        self.candidates = []
+        self.hashes = set()
+        self.X = []
+        self.y = []
+        self.pending = [self.copy_candidate(metagrammar.get_candidate())]
+
+
+    def encode(self, candidate: list) -> np.ndarray:
+        """
+        Encodes candidate as a bitstring (see above)
+        """
+        active_rules, options = self.metagrammar.split_candidate(candidate)
+        bits = [bool(x) for a in active_rules for row in a for x in row]
+        if self.metagrammar.solver_options:
+            options = options or {}
+            bits += [options.get(name) == value for name, values in SOLVER_OPTIONS.items() for value in values]
+        return np.array(bits, dtype=float)
+
+
+    def kernel(
+        self,
+        A: np.ndarray,
+        B: np.ndarray,
+        lengthscale: float,
+    ) -> np.ndarray:
+        """
+        Returns the kernel between every row of A and every row of B
+        """
+        hamming = A @ (1 - B).T + (1 - A) @ B.T
+        return np.exp(-lengthscale * hamming / A.shape[1])
+
+
+    def fit(
+        self,
+        X: np.ndarray,
+        y: np.ndarray,
+        lengthscale: float,
+    ) -> (np.ndarray, np.ndarray, float):
+        """
+        Fits the Gaussian process to the standardized scores y of X. Returns the Cholesky
+        factor of the kernel matrix, the weights of the training points and the log
+        marginal likelihood.
+        """
+        K = self.kernel(X, X, lengthscale) + self.noise * np.eye(len(X))
+        L = np.linalg.cholesky(K)
+        alpha = np.linalg.solve(L.T, np.linalg.solve(L, y))
+        likelihood = -0.5 * y @ alpha - np.log(np.diag(L)).sum() - 0.5 * len(X) * math.log(2 * math.pi)
+        return L, alpha, likelihood
+
+
+    def predict(
+        self,
+        X: np.ndarray,
+        L: np.ndarray,
+        alpha: np.ndarray,
+        points: np.ndarray,
+    ) -> (np.ndarray, np.ndarray):
+        """
+        Returns the mean and standard deviation of the model fit on X at points
+        """
+        Ks = self.kernel(X, points, self.lengthscale)
+        v = np.linalg.solve(L, Ks)
+        mean = Ks.T @ alpha
+        variance = np.maximum(1 - (v ** 2).sum(axis=0), 1e-12)
+        return mean, np.sqrt(variance)
+
+
+    def expected_improvement(
+        self,
+        mean: np.ndarray,
+        std: np.ndarray,
+        best: float,
+    ) -> np.ndarray:
+        """
+        Returns the expected improvement (a decrease of the score) below best
+        """
+        z = (best - mean) / std
+        cdf = 0.5 * (1 + np.vectorize(math.erf)(z / math.sqrt(2)))
+        pdf = np.exp(-0.5 * z ** 2) / math.sqrt(2 * math.pi)
+        return (best - mean) * cdf + std * pdf
+
+
+    def get_proposals(self) -> list:
+        """
+        Returns up to num_proposals distinct unscored candidates: half random, half
+        neighbors of the best candidates so far
+        """
+        parents = [self.candidates[i] for i in np.argsort(self.y)[:self.num_parents]]
+        ret = {}
+        for i in range(self.num_proposals):
+            if i % 2 == 0 or not parents:
+                c = self.random_candidate()
+            else:
+                c = self.neighbor(self.rng.choice(parents), self.rng.randint(1, self.max_flips))
+            h = self.metagrammar.canonical_hash(c)
+            if h not in self.seen:
+                ret[h] = c
+        return list(ret.values())
+
+
+    def ask(self, n: int) -> list:
+        while len(self.pending) + len(self.candidates) < self.num_initial:
+            self.pending.append(self.random_candidate())
+        if self.pending:
+            ret, self.pending = self.pending[:n], self.pending[n:]
+            return ret
+
+        y = np.log1p(np.array(self.y, dtype=float))
+        mean, std = y.mean(), y.std() or 1
+        X = np.array(self.X)
+        y = (y - mean) / std
+        self.lengthscale = max(self.LENGTHSCALES, key=lambda l: self.fit(X, y, l)[2])
+
+        proposals = self.get_proposals()
+        points = np.array([self.encode(c) for c in proposals])
+        ret = []
+        while proposals and len(ret) < n:
+            L, alpha, _ = self.fit(X, y, self.lengthscale)
+            mu, sigma = self.predict(X, L, alpha, points)
+            i = int(np.argmax(self.expected_improvement(mu, sigma, y.min())))
+            ret.append(proposals[i])
+            # Kriging believer: assume the picked candidate scores as predicted
+            X = np.vstack([X, points[i]])
+            y = np.append(y, mu[i])
+            proposals.pop(i)
+            points = np.delete(points, i, axis=0)
+        print("[DEBUG] Lengthscale: ", self.lengthscale, " | Proposals: ", len(points) + len(ret))
+        return ret
+
+
+    def tell(
+        self,
+        candidates: list,
+        results: list,
+    ):
+        super().tell(candidates, results)
+        for candidate, result in zip(candidates, results):
+            h = self.metagrammar.canonical_hash(candidate)
+            if h not in self.hashes:
+                self.hashes.add(h)
+                self.candidates.append(candidate)
+                self.X.append(self.encode(candidate))
+                self.y.append(result[0])
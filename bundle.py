@@ -0,0 +1,179 @@
+import argparse
+import hashlib
+import json
+import os
+import shlex
+from pathlib import Path
+from sexp_utils import *
+from metagrammar import Metagrammar
+from rulespec import load_rule
+from solve import load_pool
+from solveroptions import options_to_string
+
+
+"""
+A bundle holds the solver runs needed to score a list of candidates on a list of problems,
+so they can be run outside of Python (e.g. with GNU parallel or on a batch cluster):
+
+    bundle_dir/
+        problems/<hash>.sl   generated problems, one per distinct content (SHA-1 of the file)
+        outputs/<job>.out    output of each job, written by the commands
+        commands.txt         one shell command per job, to run from bundle_dir
+        manifest.json        candidates, problems, jobs and which job scores which problem
+
+A job is a distinct (generated problem, solver options) pair, so candidates that generate
+the same problem with the same options share a job. For example:
+
+    python bundle.py export benchmarks/.../ bundles/sweep --pool results/pool.txt -k 50
+    (cd bundles/sweep && parallel -j 32 < commands.txt)
+    python bundle.py ingest bundles/sweep
+"""
+
+
+def export_bundle(
+    metagrammar: Metagrammar,
+    problem_dir: str,
+    problems: list,
+    candidates: list,
+    bundle_dir: str,
+    timeout: int = 300,
+    seed: int = 1,
+) -> dict:
+    """
+    Writes the bundle scoring candidates on problems to bundle_dir (see above) with the
+    solver command of Metagrammar.get_solver_command and returns its manifest
+    """
+    Path(bundle_dir, "problems").mkdir(parents=True, exist_ok=True)
+    Path(bundle_dir, "outputs").mkdir(parents=True, exist_ok=True)
+
+    jobs = {}
+    entries = []
+    for index, c in enumerate(candidates):
+        m = metagrammar.copy_with_active_rules(c)
+        options = options_to_string(m.solver_options)
+        for fname in problems:
+            p = m.get_problem(problem_dir, fname)
+            try:
+                grammar = export_grammar(m.generate_grammar_from_rules(p))
+            except ValueError:
+                # No rule for the problem, the entry counts as unsolved
+                entries.append([index, fname, None, None])
+                continue
+            data = p.export_with_grammar_string(grammar)
+            content_hash = hashlib.sha1(data.encode()).hexdigest()
+            job = hashlib.sha1((content_hash + "\n" + options).encode()).hexdigest()[:16]
+
+            if job not in jobs:
+                path = os.path.join("problems", content_hash + ".sl")
+                if not os.path.isfile(os.path.join(bundle_dir, path)):
+                    with open(os.path.join(bundle_dir, path), 'w') as f:
+                        f.write(data)
+                sh_cmd = m.get_solver_command("", path, timeout=timeout, seed=seed)
+                jobs[job] = {
+                    "file": path,
+                    "output": os.path.join("outputs", job + ".out"),
+                    "command": shlex.join(sh_cmd) + " > " + shlex.quote(os.path.join("outputs", job + ".out")) + " 2>&1",
+                }
+            entries.append([index, fname, job, m.get_fingerprint(problem_dir, fname, grammar)])
+
+    manifest = {
+        "problem_dir": problem_dir,
+        "problems": problems,
+        "candidates": [metagrammar.to_string(c) for c in candidates],
+        "jobs": jobs,
+        # [candidate index, problem, job, fingerprint (see Metagrammar.get_fingerprint)]
+        "entries": entries,
+    }
+    with open(os.path.join(bundle_dir, "manifest.json"), 'w') as f:
+        json.dump(manifest, f, indent=1)
+    with open(os.path.join(bundle_dir, "commands.txt"), 'w') as f:
+        for job in jobs.values():
+            f.write(job["command"] + "\n")
+    print("[DEBUG] Candidates: ", len(candidates), " | Problems: ", len(problems), " | Jobs: ", len(jobs),
+          " | Files: ", len(set(job["file"] for job in jobs.values())))
+    return manifest
+
+
+def ingest_bundle(
+    metagrammar: Metagrammar,
+    bundle_dir: str,
+    weights: list = None,
+) -> list:
+    """
+    Parses the outputs of the jobs of the bundle in bundle_dir (see
+    Metagrammar.parse_solver_output) and returns the (score, num_unsolved, num_solved) of
+    each candidate in order, as Metagrammar.score would (see weights there). Jobs whose
+    output is missing, or that solved their problem without reporting a time, are not
+    known yet: they are left out of the scores and of the result cache, so running them
+    and ingesting the bundle again completes it. Other results are added to the result
+    cache of metagrammar, so scoring the same candidates again does not run the solver.
+    """
+    if metagrammar.time_source == "cpu":
+        raise ValueError("Bundles only record the time reported by CVC5, not the CPU time")
+    with open(os.path.join(bundle_dir, "manifest.json"), 'r') as f:
+        manifest = json.load(f)
+
+    records = {}
+    for job, info in manifest["jobs"].items():
+        try:
+            with open(os.path.join(bundle_dir, info["output"]), 'r') as f:
+                output = f.read()
+        except FileNotFoundError:
+            continue
+        result, time_to_solve = metagrammar.parse_solver_output(output)
+        if result != "timeout or fail" and time_to_solve is None:
+            # Interrupted after printing its solution, the time it took is unknown
+            continue
+        # Note: the CPU time of runs outside of the driver is unknown
+        records[job] = {"result": result, "time_to_solve": time_to_solve, "cpu_time": None}
+
+    unsupported = {"result": "timeout or fail", "time_to_solve": None, "cpu_time": None}
+    problem_indices = {fname: i for i, fname in enumerate(manifest["problems"])}
+    candidate_records = [[] for _ in manifest["candidates"]]
+    candidate_weights = [[] for _ in manifest["candidates"]]
+    num_unknown = 0
+    for index, fname, job, fingerprint in manifest["entries"]:
+        if job is not None and job not in records:
+            num_unknown += 1
+            continue
+        record = dict(records[job] if job is not None else unsupported, problem=fname)
+        candidate_records[index].append(record)
+        candidate_weights[index].append(weights[problem_indices[fname]] if weights is not None else 1)
+        if fingerprint is not None and fingerprint not in metagrammar.result_cache:
+            metagrammar.cache_result(fingerprint, record)
+
+    if num_unknown:
+        print("[DEBUG] Entries without a result (left out of the scores): ", num_unknown, "/",
+              len(manifest["entries"]), " | Jobs: ", len(manifest["jobs"]) - len(records), "/", len(manifest["jobs"]))
+    return [metagrammar.aggregate_records(r, w) for r, w in zip(candidate_records, candidate_weights)]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export solver runs as a bundle or ingest their results")
+    subparsers = parser.add_subparsers(dest="mode", required=True)
+    export_parser = subparsers.add_parser("export")
+    ingest_parser = subparsers.add_parser("ingest")
+    for subparser in [export_parser, ingest_parser]:
+        subparser.add_argument("--rules", nargs="+", default=["rules/bitvec.json"],
+                               help="Rule specifications the pool was learned with")
+    export_parser.add_argument("problem_dir", help="Directory of the .sl problems")
+    export_parser.add_argument("bundle_dir", help="Directory the bundle is written to")
+    export_parser.add_argument("--pool", default="results/pool.txt", help="Pool of candidates (see solve.py)")
+    export_parser.add_argument("-k", type=int, default=None, help="Number of candidates of the pool to export")
+    export_parser.add_argument("--timeout", type=int, default=300, help="Timeout of each solver in ms")
+    ingest_parser.add_argument("bundle_dir", help="Directory of the bundle")
+    args = parser.parse_args()
+
+    m = Metagrammar()
+    for filename in args.rules:
+        m.add_rule(load_rule(filename))
+
+    if args.mode == "export":
+        problem_dir = os.path.join(args.problem_dir, "")
+        problems = sorted(f for f in os.listdir(problem_dir) if f.endswith(".sl"))
+        export_bundle(m, problem_dir, problems, load_pool(m, args.pool, args.k), args.bundle_dir, args.timeout)
+    else:
+        with open(os.path.join(args.bundle_dir, "manifest.json"), 'r') as f:
+            candidates = json.load(f)["candidates"]
+        for s, (score, num_unsolved, num_solved) in zip(candidates, ingest_bundle(m, args.bundle_dir)):
+            print(s, score, num_unsolved, num_solved)
@@ -0,0 +1,23 @@
+import random
+from solveroptions import random_options
+
+
+"""
+Helpers shared by the optimizers and the drivers to draw candidates. A candidate is a list
+of active_rules matrices, one per rule of the metagrammar, followed by its solver options
+if the metagrammar has any (see solveroptions.py).
+"""
+
+
+def rand_bool_list(x, y, rng=random):
+    ret = []
+    for i in range(x):
+        ret.append(rng.choices([True, False], k = y))
+    return ret
+
+def rand_candidate(m, rng=random):
+    # One matrix per rule, followed by the solver options if they are searched
+    ret = [rand_bool_list(r.get_num_nonterminals(), r.get_num_subrules(), rng) for r in m.rules]
+    if m.solver_options:
+        ret.append(random_options(rng))
+    return ret
@@ -0,0 +1,266 @@
+import mmap
+import os
+import pickle
+import struct
+import sys
+import tempfile
+from sexp_utils import *
+from sygusproblem import LazySyGuSProblem
+
+
+"""
+A compact corpus stores a set of problems in a single blob:
+
+    MGCORPUS | length of the index (8 bytes) | pickled index | texts of the problems
+
+The index holds, per problem, only what generating and exporting a grammar needs (logic,
+sorts, constants, variables, features and the offsets of the grammar in the text) as
+plain strings and numbers. The blob is written once to a file, by default in /dev/shm,
+and memory-mapped read-only by every process that uses it, so the texts are shared by
+all workers instead of being copied (or parsed) by each of them.
+"""
+
+
+MAGIC = b"MGCORPUS"
+
+# Parsed sorts by their text, shared by every CompactProblem of the process
+SORT_CACHE = {}
+
+
+def get_sort(text: str):
+    """
+    Gets the parsed sort of text e.g. "(_ BitVec 4)", parsing it only once per process
+    """
+    if text not in SORT_CACHE:
+        SORT_CACHE[text] = create_symbol(text)
+    return SORT_CACHE[text]
+
+
+def intern_all(x):
+    """
+    Interns the strings of x, a string or a nested tuple/list/dict of strings
+    """
+    if type(x) == str:
+        return sys.intern(x)
+    if type(x) in (tuple, list):
+        return type(x)(intern_all(y) for y in x)
+    if type(x) == dict:
+        return {intern_all(k): intern_all(v) for k, v in x.items()}
+    return x
+
+
+class CompactProblem:
+    """
+    A problem of a CompactCorpus. It has the methods of SyGuSProblem that Metagrammar and
+    the subrules of rulespec.py use to generate and export a grammar, and reads its text
+    from the memory-mapped blob of its corpus.
+    """
+
+    __slots__ = ("corpus", "key", "name", "start", "header_end", "suffix_start", "end", "logic", "return_sort",
+                 "parameter_sorts", "constants", "variables", "features")
+
+    def __init__(
+        self,
+        corpus,
+        key: str,
+        entry: tuple,
+    ):
+        """
+        Creates the problem key (its path) of corpus from its entry in the index
+        """
+        self.corpus = corpus
+        self.key = key
+        (self.name, self.start, self.header_end, self.suffix_start, self.end, self.logic, self.return_sort,
+         self.parameter_sorts, self.constants, self.variables, self.features) = entry
+
+
+    def __reduce__(self):
+        """
+        Pickles the problem as a reference into its corpus, which is opened again (not
+        copied) by the process that unpickles it
+        """
+        return (CompactCorpus.get_problem, (self.corpus, self.key))
+
+
+    def get_logic(self) -> str:
+        return self.logic
+
+
+    def get_return_type(self):
+        return get_sort(self.return_sort)
+
+
+    def get_parameter_sorts(self) -> list:
+        return [get_sort(s) for s in self.parameter_sorts]
+
+
+    def get_constants(self) -> list:
+        return list(self.constants)
+
+
+    def get_variables(self, sort = None) -> list:
+        key = None if sort is None else export_sexp_raw(sort)
+        return [name for name, s in self.variables if key is None or s == key]
+
+
+    def get_features(self) -> dict:
+        return self.features
+
+
+    def get_text(self) -> bytes:
+        """
+        Gets the original text of the problem
+        """
+        return bytes(self.corpus.buffer[self.start:self.end])
+
+
+    def export_with_grammar_string(
+        self,
+        grammar: str,
+    ) -> str:
+        """
+        Returns the original text of the problem with the grammar of the synth-fun replaced
+        by grammar (see LazySyGuSProblem.export_with_grammar_string)
+        """
+        buffer = self.corpus.buffer
+        return (bytes(buffer[self.start:self.header_end]).decode() + " " + grammar +
+                bytes(buffer[self.suffix_start:self.end]).decode())
+
+
+    def export_with_new_grammar(
+        self,
+        new_grammar: list,
+    ) -> str:
+        return self.export_with_grammar_string(export_grammar(new_grammar))
+
+
+class CompactCorpus:
+    """
+    A CompactCorpus is a set of CompactProblems backed by a memory-mapped blob (see
+    above). Problems are keyed by their path (problem_dir + problem_name) like the problem
+    cache of a Metagrammar (see Metagrammar.use_corpus). A corpus sent to another process
+    (e.g. with the metagrammar using it) is opened again from its file there.
+    """
+
+    def __init__(self, filename: str):
+        """
+        Opens the blob written to filename by create
+        """
+        self.filename = filename
+        with open(filename, 'rb') as f:
+            self.buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        assert self.buffer[:len(MAGIC)] == MAGIC, "Not a compact corpus: " + filename
+        (index_length,) = struct.unpack_from("<Q", self.buffer, len(MAGIC))
+        index_start = len(MAGIC) + 8
+        index = intern_all(pickle.loads(self.buffer[index_start:index_start + index_length]))
+
+        # Offsets in the index are relative to the start of the texts
+        texts_start = index_start + index_length
+        self.problems = {}
+        for key, (name, start, header_end, suffix_start, end, *rest) in index:
+            entry = (name, texts_start + start, texts_start + header_end, texts_start + suffix_start,
+                     texts_start + end, *rest)
+            self.problems[key] = CompactProblem(self, key, entry)
+
+
+    def __reduce__(self):
+        return (CompactCorpus.open, (self.filename,))
+
+
+    def __len__(self):
+        return len(self.problems)
+
+
+    def get_problem(self, key: str) -> CompactProblem:
+        """
+        Gets the problem at path key
+        """
+        return self.problems[key]
+
+
+    def unlink(self):
+        """
+        Removes the file of the corpus, processes that opened it keep their mapping
+        """
+        try:
+            os.remove(self.filename)
+        except FileNotFoundError:
+            pass
+
+
+    @staticmethod
+    def open(filename: str):
+        """
+        Opens the corpus at filename once per process
+        """
+        if filename not in OPEN_CORPORA:
+            OPEN_CORPORA[filename] = CompactCorpus(filename)
+        return OPEN_CORPORA[filename]
+
+
+    @staticmethod
+    def create(
+        problem_dir: str,
+        problems: list,
+        filename: str = None,
+    ):
+        """
+        Reads problems (paths relative to problem_dir), writes them as a blob to filename
+        (by default a new file in /dev/shm, or in the temporary directory if there is no
+        /dev/shm) and opens it. Problems that cannot be read are left out.
+        """
+        index = []
+        texts = bytearray()
+        for fname in problems:
+            p = LazySyGuSProblem(fname)
+            try:
+                p.read_sygus_problem(problem_dir, fname)
+                entry = CompactCorpus.get_entry(p, len(texts))
+            except Exception as e:
+                print("[DEBUG] Skipping: ", problem_dir + fname, " | Error: ", e)
+                continue
+            index.append((problem_dir + fname, entry))
+            texts += p.text
+
+        if filename is None:
+            scratch_dir = "/dev/shm" if os.path.isdir("/dev/shm") else None
+            fd, filename = tempfile.mkstemp(prefix="metagrammar_corpus_", suffix=".bin", dir=scratch_dir)
+            os.close(fd)
+        data = pickle.dumps(index)
+        with open(filename, 'wb') as f:
+            f.write(MAGIC)
+            f.write(struct.pack("<Q", len(data)))
+            f.write(data)
+            f.write(texts)
+        return CompactCorpus.open(filename)
+
+
+    @staticmethod
+    def get_entry(
+        p: LazySyGuSProblem,
+        offset: int,
+    ) -> tuple:
+        """
+        Gets the entry of the index of a problem whose text starts at offset
+        """
+        # Offsets of the prefix and suffix in the text (see LazySyGuSProblem.read_sygus_problem)
+        header_end = len(p.prefix.encode())
+        suffix_start = len(p.text) - len(p.suffix.encode())
+        return (
+            p.name,
+            offset,
+            offset + header_end,
+            offset + suffix_start,
+            offset + len(p.text),
+            p.get_logic(),
+            export_sexp_raw(p.get_return_type()),
+            tuple(export_sexp_raw(s) for s in p.get_parameter_sorts()),
+            tuple(p.get_constants()),
+            tuple(dict.fromkeys((dumps(d[1]), export_sexp_raw(d[2])) for d in p.defines_and_declares
+                                if dumps(d[0]) == "declare-var")),
+            p.get_features(),
+        )
+
+
+# Corpora opened by this process by filename (see CompactCorpus.open)
+OPEN_CORPORA = {}
@@ -0,0 +1,69 @@
+import os
+import random
+from os import listdir
+from os.path import isfile, join
+from metagrammar import Metagrammar
+from rulespec import load_rule
+from solveroptions import default_options
+from search import OPTIMIZERS
+
+
+"""
+Runs every optimizer of OPTIMIZERS (see search.py) with the same budget of solver seconds on the same
+training problems and writes the best score versus solver seconds curve of each to
+CURVE_DIR/<name>.csv (see Optimizer.run). Each optimizer starts from a fresh Metagrammar,
+so none of them is answered by the result cache of another.
+"""
+
+
+# Solver seconds each optimizer may spend, and the number of candidates scored at once
+SOLVER_BUDGET = 3600
+BATCH_SIZE = 4
+# Search CVC5 options (see solveroptions.py) along with the active rules
+SEARCH_SOLVER_OPTIONS = False
+# Where the curves are written
+CURVE_DIR = "results/curves"
+
+
+def get_best_at(
+    curve: list,
+    seconds: float,
+) -> float:
+    """
+    Gets the best score of curve once seconds solver seconds were spent (inf before the
+    first batch)
+    """
+    ret = float("inf")
+    for spent, _, best_score, _ in curve:
+        if spent > seconds:
+            break
+        ret = best_score
+    return ret
+
+
+if __name__ == "__main__":
+    print("> Starting Program.")
+
+    problem_dir = "benchmarks/lib/General_Track/bv-conditional-inverses/"
+    all_problems = sorted(f for f in listdir(problem_dir) if isfile(join(problem_dir, f)))
+    random.seed(100)
+    random.shuffle(all_problems)
+    train_problems = all_problems[:len(all_problems)//3]
+
+    curves = {}
+    for name, optimizer in OPTIMIZERS.items():
+        print("[DEBUG] Optimizer: ", name)
+        m = Metagrammar(solver_options=default_options() if SEARCH_SOLVER_OPTIONS else None)
+        m.add_rule(load_rule("rules/bitvec.json"))
+        opt = optimizer(m, problem_dir, train_problems, batch_size=BATCH_SIZE, rng=random.Random(1))
+        best_candidate, best_score, best_unsolved, best_solved = opt.run(SOLVER_BUDGET)
+        opt.write_curve(os.path.join(CURVE_DIR, name + ".csv"))
+        curves[name] = opt.curve
+        print("[DEBUG] Best String: ", m.to_string(best_candidate), " | Best Score:", best_score)
+
+    # Best score of each optimizer after each quarter of the budget
+    fractions = [0.25, 0.5, 0.75, 1]
+    print("optimizer", *[str(int(100 * f)) + "%" for f in fractions], sep="\t")
+    for name, curve in curves.items():
+        print(name, *[get_best_at(curve, f * SOLVER_BUDGET) for f in fractions], sep="\t")
+    print("> Ending Program.")
@@ -0,0 +1,189 @@
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from metagrammar import Metagrammar
+
+
+class Coreset:
+    """
+    A Coreset picks a small weighted subset of the training problems whose weighted score
+    tracks the score on all of them, so each candidate is scored on a fraction of the
+    problems. Problems are described by their solve-time profile (their score under each
+    of a set of already evaluated candidates) and their static features (see
+    SyGuSProblem.get_features), clustered with k-means, and the problem closest to the
+    center of each cluster is picked with the size of its cluster as weight.
+
+    The weights are passed to Metagrammar.score (or to HillClimber, IslandModel, ...)
+    along with the subset. How well the coreset tracks the full set is measured on
+    held-out candidates, since the candidates it was clustered on fit it by construction.
+    """
+
+    def __init__(
+        self,
+        metagrammar: Metagrammar,
+        problem_dir: str,
+        problems: list,
+        size: int = 10,
+        feature_weight: float = 0.5,
+        seed: int = 1,
+    ):
+        """
+        Creates a Coreset of size problems out of problems. feature_weight is the weight of
+        the static features relative to the solve-time profiles when clustering.
+        """
+        self.metagrammar = metagrammar
+        self.problem_dir = problem_dir
+        self.problems = problems
+        self.size = size
+        self.feature_weight = feature_weight
+        self.rng = np.random.default_rng(seed)
+
+
+    def get_profiles(
+        self,
+        candidates: list,
+        num_workers: int = None,
+    ) -> np.ndarray:
+        """
+        Scores every candidate on every problem and returns the scores (see
+        Metagrammar.get_record_score) as a matrix with one row per problem and one column
+        per candidate. Results already in the result cache are reused.
+        """
+        m = self.metagrammar
+        copies = [m.copy_with_active_rules(c) for c in candidates]
+        if num_workers is None:
+            num_workers = min(len(copies), len(m.core_pool)) if m.core_pool else len(copies)
+        with ThreadPoolExecutor(max_workers=num_workers) as executor:
+            records = list(executor.map(lambda mc: mc.score_problems(self.problem_dir, self.problems), copies))
+        return np.array([[m.get_record_score(r) for r in column] for column in records], dtype=float).T
+
+
+    def get_features(self) -> np.ndarray:
+        """
+        Returns the static features of every problem as a matrix with one row per problem:
+        the counts of get_features, the number of constants and the number of uses of each
+        operator used by any of the problems
+        """
+        features = [self.metagrammar.get_problem(self.problem_dir, p).get_features() for p in self.problems]
+        operators = sorted(set(op for f in features for op in f["operators"]))
+        counts = ["num_variables", "num_parameters", "num_define_funs", "num_constraints", "max_depth"]
+        return np.array([[f[c] for c in counts] + [len(f["constants"])] +
+                         [f["operators"].get(op, 0) for op in operators] for f in features], dtype=float)
+
+
+    def get_points(
+        self,
+        profiles: np.ndarray,
+    ) -> np.ndarray:
+        """
+        Returns the points that are clustered, one per problem: the standardized log of the
+        profiles followed by the standardized features scaled by feature_weight
+        """
+        def standardize(x):
+            std = x.std(axis=0)
+            return (x - x.mean(axis=0)) / np.where(std > 0, std, 1)
+        points = [standardize(np.log1p(profiles))]
+        if self.feature_weight:
+            points.append(self.feature_weight * standardize(self.get_features()))
+        return np.hstack(points)
+
+
+    def cluster(
+        self,
+        points: np.ndarray,
+        num_iterations: int = 100,
+    ) -> np.ndarray:
+        """
+        Clusters points into size clusters with k-means (initialized with k-means++) and
+        returns the cluster of each point
+        """
+        # k-means++: each next center is a point picked with probability proportional to
+        # its squared distance to the closest center so far
+        centers = [points[self.rng.integers(len(points))]]
+        for _ in range(1, self.size):
+            distances = np.min([((points - c) ** 2).sum(axis=1) for c in centers], axis=0)
+            if distances.sum() == 0:
+                break
+            centers.append(points[self.rng.choice(len(points), p=distances / distances.sum())])
+        centers = np.array(centers)
+
+        labels = None
+        for _ in range(num_iterations):
+            distances = ((points[:, None, :] - centers[None, :, :]) ** 2).sum(axis=2)
+            new_labels = distances.argmin(axis=1)
+            if labels is not None and (new_labels == labels).all():
+                break
+            labels = new_labels
+            for k in range(len(centers)):
+                if (labels == k).any():
+                    centers[k] = points[labels == k].mean(axis=0)
+        return labels
+
+
+    def select(
+        self,
+        profiles: np.ndarray,
+    ) -> (list, list):
+        """
+        Picks the problem closest to the center of each cluster, weighted by the number of
+        problems in the cluster. Returns the indices of the picked problems and their
+        weights.
+        """
+        if self.size >= len(self.problems):
+            return list(range(len(self.problems))), [1] * len(self.problems)
+
+        points = self.get_points(profiles)
+        labels = self.cluster(points)
+        indices, weights = [], []
+        for k in sorted(set(labels)):
+            members = np.flatnonzero(labels == k)
+            center = points[members].mean(axis=0)
+            closest = members[((points[members] - center) ** 2).sum(axis=1).argmin()]
+            indices.append(int(closest))
+            weights.append(len(members))
+        return indices, weights
+
+
+    @staticmethod
+    def get_correlation(
+        profiles: np.ndarray,
+        indices: list,
+        weights: list,
+    ) -> (float, float):
+        """
+        Returns the Pearson and Spearman (rank) correlations between the weighted scores of
+        the candidates on the problems at indices and their scores on all of the problems
+        """
+        full = profiles.sum(axis=0)
+        subset = (profiles[indices] * np.array(weights)[:, None]).sum(axis=0)
+        if len(full) < 2 or full.std() == 0 or subset.std() == 0:
+            return float("nan"), float("nan")
+
+        def rank(x):
+            return np.argsort(np.argsort(x)).astype(float)
+        return float(np.corrcoef(full, subset)[0, 1]), float(np.corrcoef(rank(full), rank(subset))[0, 1])
+
+
+    def build(
+        self,
+        candidates: list,
+        holdout: list,
+        num_workers: int = None,
+    ) -> dict:
+        """
+        Profiles the problems with candidates (see get_profiles) and picks the coreset from
+        their profiles. Returns its problems and weights along with the correlations it
+        achieves on the held-out candidates holdout, which play no part in picking it (see
+        get_correlation), and the fraction of the solver time of the full set of problems
+        it takes
+        """
+        profiles = self.get_profiles(candidates + holdout, num_workers)
+        indices, weights = self.select(profiles[:, :len(candidates)])
+        pearson, spearman = self.get_correlation(profiles[:, len(candidates):], indices, weights)
+        total = profiles.sum()
+        return {
+            "problems": [self.problems[i] for i in indices],
+            "weights": weights,
+            "pearson": pearson,
+            "spearman": spearman,
+            "time_fraction": float(profiles[indices].sum() / total) if total else 0.0,
+        }
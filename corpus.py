@@ -0,0 +1,220 @@
+import hashlib
+import math
+import os
+import random
+import sys
+import pandas as pd
+from pathlib import Path
+from sexp_utils import *
+from sygusproblem import LazySyGuSProblem
+
+
+# Columns of the manifest, one row per SyGuS problem (.sl file)
+MANIFEST_COLUMNS = [
+    "path",             # Path to the problem
+    "hash",             # SHA-1 of the contents of the file
+    "mtime_ns",         # Modification time (in ns) when the file was last indexed
+    "size",             # Size of the file in bytes
+    "logic",            # Logic given by set-logic e.g. BV
+    "synth_fun",        # Name of the synthesis function
+    "parameter_sorts",  # Sorts of the parameters of the synthesis function, space separated
+    "return_sort",      # Return sort of the synthesis function e.g. (_ BitVec 4)
+    "width",            # Width of the return sort if it is a bit-vector
+    "num_parameters",   # Number of parameters of the synthesis function
+    "num_constants",    # Number of constants (see SyGuSProblem.get_constants)
+    "num_variables",    # Number of declared variables
+    "baseline_time",    # Time to solve with the original grammar (see measure_baseline)
+    "baseline_solved",  # Whether the problem was solved with the original grammar
+    "error",            # Error when reading the problem, if any
+]
+
+
+class Corpus:
+    """
+    A Corpus is an index of the SyGuS problems found under a set of directories, stored as
+    a manifest (CSV file) with one row per problem (see MANIFEST_COLUMNS). Scanning again
+    only re-reads files whose size or modification time changed, and the manifest can be
+    queried and split into train/test sets without parsing any of the problems.
+    """
+
+    def __init__(self, manifest_path: str = "results/manifest.csv"):
+        """
+        Creates a corpus backed by the manifest at manifest_path, loading it if it exists
+        """
+        self.manifest_path = manifest_path
+        if os.path.isfile(manifest_path):
+            self.manifest = pd.read_csv(manifest_path, keep_default_na=False, na_values=[""])
+        else:
+            self.manifest = pd.DataFrame(columns=MANIFEST_COLUMNS)
+
+
+    def scan(
+        self,
+        dirs: list,
+    ):
+        """
+        Indexes every .sl file under dirs, reusing the rows of files that did not change,
+        dropping the rows of files that no longer exist, and saves the manifest
+        """
+        old_rows = {row["path"]: row for row in self.manifest.to_dict("records")}
+        rows = []
+        num_indexed = 0
+        for d in dirs:
+            for path in sorted(str(p) for p in Path(d).rglob("*.sl")):
+                stat = os.stat(path)
+                old = old_rows.get(path)
+                if old is not None and old["size"] == stat.st_size and old["mtime_ns"] == stat.st_mtime_ns:
+                    rows.append(old)
+                else:
+                    rows.append(self.index_problem(path, stat, old))
+                    num_indexed += 1
+
+        self.manifest = pd.DataFrame(rows, columns=MANIFEST_COLUMNS)
+        self.save()
+        print("[DEBUG] Indexed: ", num_indexed, " | Total Problems: ", len(rows))
+        return self
+
+
+    def index_problem(
+        self,
+        path: str,
+        stat: os.stat_result,
+        old: dict = None,
+    ) -> dict:
+        """
+        Reads a single problem and returns its row of the manifest. If the contents did not
+        change since old was indexed, the baseline measurements of old are kept.
+        """
+        with open(path, 'rb') as f:
+            content_hash = hashlib.sha1(f.read()).hexdigest()
+
+        row = dict.fromkeys(MANIFEST_COLUMNS)
+        row.update({"path": path, "hash": content_hash, "mtime_ns": stat.st_mtime_ns, "size": stat.st_size})
+        if old is not None and old["hash"] == content_hash:
+            row["baseline_time"] = old["baseline_time"]
+            row["baseline_solved"] = old["baseline_solved"]
+
+        try:
+            p = LazySyGuSProblem(os.path.basename(path))
+            p.read_sygus_problem("", path)
+            ret = p.get_return_type()
+            row.update({
+                "logic": p.get_logic(),
+                "synth_fun": dumps(p.synth_fun_name[0]),
+                "parameter_sorts": " ".join(export_sexp_raw(s) for s in p.get_parameter_sorts()),
+                "return_sort": export_sexp_raw(ret),
+                "width": ret[2] if type(ret) == list and len(ret) == 3 and dumps(ret[1]) == "BitVec" else None,
+                "num_parameters": len(p.get_parameter_sorts()),
+                "num_constants": len(p.get_constants()),
+                "num_variables": len(p.get_variables()),
+            })
+        except Exception as e:
+            row["error"] = str(e)
+        return row
+
+
+    def measure_baseline(
+        self,
+        metagrammar,
+        paths: list = None,
+    ):
+        """
+        Runs the problems at paths (by default all problems not measured yet) with their
+        original grammar using metagrammar.run_solver and saves the results in the manifest
+        """
+        if paths is None:
+            paths = self.manifest[self.manifest["baseline_time"].isna()]["path"].tolist()
+
+        for path in paths:
+            record = metagrammar.run_solver("", path)
+            idx = self.manifest["path"] == path
+            self.manifest.loc[idx, "baseline_time"] = float(metagrammar.get_record_time(record))
+            self.manifest.loc[idx, "baseline_solved"] = record["result"] != "timeout or fail"
+        self.save()
+
+
+    def save(self):
+        """
+        Writes the manifest to manifest_path
+        """
+        Path(os.path.dirname(self.manifest_path) or ".").mkdir(parents=True, exist_ok=True)
+        self.manifest.to_csv(self.manifest_path, index=False)
+
+
+    """
+    ===============
+    |QUERY Methods|
+    ===============
+    """
+
+
+    def query(
+        self,
+        expr: str = None,
+        **filters,
+    ) -> pd.DataFrame:
+        """
+        Returns the rows of the manifest matching every filter (column=value, or
+        column=list of values) and the pandas query expr if given, e.g.
+        corpus.query("size < 2000", logic="BV", width=[4, 8])
+        Problems that could not be read are left out.
+        """
+        ret = self.manifest[self.manifest["error"].isna()]
+        for column, value in filters.items():
+            if type(value) == list:
+                ret = ret[ret[column].isin(value)]
+            else:
+                ret = ret[ret[column] == value]
+        if expr is not None:
+            ret = ret.query(expr)
+        return ret
+
+
+    def get_paths(
+        self,
+        rows: pd.DataFrame = None,
+    ) -> list:
+        """
+        Gets the paths of rows (by default every readable problem). Paths can be passed to
+        Metagrammar.score with an empty problem_dir.
+        """
+        if rows is None:
+            rows = self.query()
+        return rows["path"].tolist()
+
+
+    def stratified_split(
+        self,
+        rows: pd.DataFrame = None,
+        train_fraction: float = 0.5,
+        by: tuple = ("logic", "return_sort"),
+        seed: int = 1,
+    ) -> (list, list):
+        """
+        Splits the paths of rows (by default every readable problem) into train and test
+        sets so that each group of problems with the same values in the columns by is
+        split with the same train_fraction. The size of the train part of each group is
+        rounded up, so a group of a single problem goes to train and every group is seen
+        in training.
+        """
+        if rows is None:
+            rows = self.query()
+        rng = random.Random(seed)
+
+        train, test = [], []
+        for _, group in rows.groupby(list(by), dropna=False, sort=True):
+            paths = sorted(group["path"].tolist())
+            rng.shuffle(paths)
+            # Note: rounded first so that e.g. 10 * 0.3 = 3.0000000000000004 is not rounded up to 4
+            num_train = math.ceil(round(len(paths) * train_fraction, 9))
+            train += paths[:num_train]
+            test += paths[num_train:]
+        return train, test
+
+
+if __name__ == "__main__":
+    # Usage: python corpus.py [DIR ...]
+    # Indexes the problems under the given directories (by default the benchmark submodules)
+    dirs = sys.argv[1:] or ["benchmarks/", "SyGuS_Benchmarks/"]
+    corpus = Corpus().scan(dirs)
+    print(corpus.query().groupby(["logic", "return_sort"], dropna=False).size())
@@ -0,0 +1,195 @@
+import multiprocessing
+import os
+import tempfile
+import threading
+import time
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from pathlib import Path
+
+
+"""
+=========================================================
+|Ways of handing a generated SyGuS problem over to CVC5|
+=========================================================
+"""
+
+
+class Delivery(ABC):
+    """
+    A Delivery writes the text of a generated SyGuS problem somewhere that the solver can
+    read it from and keeps track of how much time is spent doing so. Use deliver as a
+    context manager, the problem is available until the end of the with block.
+    """
+
+    def __init__(self):
+        # Number of problems delivered and total time spent writing/cleaning them up
+        self.num_writes = 0
+        self.io_time = 0.0
+
+        # Deliveries can happen from several threads at once
+        self.lock = threading.Lock()
+
+
+    def __getstate__(self):
+        """
+        Pickles the delivery without its lock so it can be sent to other processes
+        """
+        state = self.__dict__.copy()
+        del state["lock"]
+        return state
+
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.lock = threading.Lock()
+
+
+    @abstractmethod
+    @contextmanager
+    def deliver(
+        self,
+        data: str,
+        problem_name: str,
+    ):
+        """
+        Yields the path to pass to the solver and the file descriptors the solver needs
+        to inherit in order to read that path
+        """
+
+
+    def get_io_stats(self) -> (int, float, float):
+        """
+        Gets the number of problems delivered, the total I/O time in seconds and the
+        average I/O time per problem
+        """
+        avg = self.io_time / self.num_writes if self.num_writes else 0.0
+        return self.num_writes, self.io_time, avg
+
+
+    def add_io_time(
+        self,
+        start: float,
+        num_writes: int = 0,
+    ):
+        """
+        Adds the time since start to the I/O time and num_writes to the number of writes
+        """
+        elapsed = time.perf_counter() - start
+        with self.lock:
+            self.io_time += elapsed
+            self.num_writes += num_writes
+
+
+class DiskDelivery(Delivery):
+    """
+    Writes problems to dest_dir (by default "results/") and leaves them there, which is
+    useful to inspect the last problem that was run. Problems delivered from worker threads
+    or processes get the process and thread ids in their name so they do not overwrite each
+    other.
+    """
+
+    def __init__(self, dest_dir: str = "results/"):
+        super().__init__()
+        self.dest_dir = dest_dir
+
+
+    @contextmanager
+    def deliver(
+        self,
+        data: str,
+        problem_name: str,
+    ):
+        start = time.perf_counter()
+        if threading.current_thread() is not threading.main_thread() or multiprocessing.parent_process():
+            problem_name = str(os.getpid()) + "_" + str(threading.get_ident()) + "_" + problem_name
+        # Create directory if path to filename does not already exist
+        Path(self.dest_dir).mkdir(parents=True, exist_ok=True)
+        with open(self.dest_dir + problem_name, 'w') as f:
+            f.write(data)
+        self.add_io_time(start, 1)
+
+        yield self.dest_dir + problem_name, ()
+
+
+class MemfdDelivery(Delivery):
+    """
+    Writes problems to anonymous memory files (see memfd_create(2)) that the solver reads
+    through /proc/self/fd/N. Nothing touches the filesystem and the memory is released as
+    soon as the file descriptor is closed. Linux only.
+    """
+
+    def __init__(self):
+        super().__init__()
+        if not hasattr(os, "memfd_create"):
+            raise ValueError("memfd delivery is not supported on this platform")
+
+
+    @contextmanager
+    def deliver(
+        self,
+        data: str,
+        problem_name: str,
+    ):
+        start = time.perf_counter()
+        fd = os.memfd_create(problem_name)
+        try:
+            view = memoryview(data.encode())
+            while view:
+                view = view[os.write(fd, view):]
+            self.add_io_time(start, 1)
+
+            # The solver inherits fd under the same number, so its /proc/self/fd/N is the file
+            yield "/proc/self/fd/" + str(fd), (fd,)
+        finally:
+            os.close(fd)
+
+
+class TmpfsDelivery(Delivery):
+    """
+    Writes problems to uniquely named files in a scratch directory, by default /dev/shm
+    (a tmpfs on most Linux systems), and removes them once the solver is done.
+    """
+
+    def __init__(self, scratch_dir: str = None):
+        super().__init__()
+        if scratch_dir is None:
+            scratch_dir = "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir()
+        self.scratch_dir = scratch_dir
+
+
+    @contextmanager
+    def deliver(
+        self,
+        data: str,
+        problem_name: str,
+    ):
+        start = time.perf_counter()
+        fd, path = tempfile.mkstemp(suffix="_" + problem_name, dir=self.scratch_dir)
+        try:
+            with os.fdopen(fd, 'w') as f:
+                f.write(data)
+            self.add_io_time(start, 1)
+
+            yield path, ()
+        finally:
+            start = time.perf_counter()
+            os.unlink(path)
+            self.add_io_time(start)
+
+
+# Delivery modes that can be selected per run
+DELIVERY_MODES = {
+    "disk": DiskDelivery,
+    "memfd": MemfdDelivery,
+    "tmpfs": TmpfsDelivery,
+}
+
+
+def create_delivery(mode: str) -> Delivery:
+    """
+    Creates the Delivery for mode, one of "disk", "memfd" or "tmpfs"
+    """
+    if mode not in DELIVERY_MODES:
+        raise ValueError("Unknown delivery mode: ", mode)
+    return DELIVERY_MODES[mode]()
@@ -1,13 +1,25 @@
+import atexit
 import pandas as pd
 import typing
 import copy
 import random
+import sys
 from os import listdir
 from os.path import isfile, join
 from sexp_utils import *
 from metagrammar import Metagrammar
 from sygusproblem import SyGuSProblem
 from rule import Rule
+from rulespec import load_rule
+from timing import calibrate
+from solve import save_pool
+from metrics import start_server, start_snapshots
+from solveroptions import default_options
+from coreset import Coreset
+from compact import CompactCorpus
+from candidates import rand_candidate
+from optimizer import GeneticOptimizer
+from island import IslandModel
 
 
 """
@@ -20,34 +32,48 @@ Things to do:
 6. Profit
 """
 
-NUM_NONTERMINALS = 3
-NUM_SUBRULES = 70
 NUM_EPOCHS = 10
+# Number of individuals kept from one generation to the next, and scored at once
+POPULATION_SIZE = 5
+NUM_WORKERS = 1
+# Number of islands evolving in parallel processes (1 runs a single population here)
+NUM_ISLANDS = 1
+# Number of epochs between two migrations of the best individuals between islands
+MIGRATION_INTERVAL = 2
+# How generated problems are handed to CVC5: "disk", "memfd" or "tmpfs"
+DELIVERY_MODE = "disk"
+# Limits of each CVC5 run: address space in MB, CPU seconds and wall-clock seconds (None for no limit)
+MEMORY_LIMIT = None
+CPU_LIMIT = None
+WALL_LIMIT = 60
+# Pin each CVC5 run to its own physical core and check timing noise before searching
+PIN_CORES = False
+# Leave operators that a problem never uses out of its grammar
+PRUNE_OPERATORS = False
+# Serve problems from one memory-mapped corpus in /dev/shm (see compact.py). Off by default: its
+# problems are pickled as references into the corpus, which only helps workers that receive a
+# pickled Metagrammar (e.g. with the "spawn" start method), while the islands are forked
+COMPACT_CORPUS = False
+# Search CVC5 options (see solveroptions.py) along with the active rules
+SEARCH_SOLVER_OPTIONS = False
+# Train on a weighted coreset of CORESET_SIZE problems (None for all training problems), picked
+# from the scores of CORESET_CANDIDATES random candidates and checked on CORESET_HOLDOUT other
+# random candidates (see coreset.py)
+CORESET_SIZE = None
+CORESET_CANDIDATES = 8
+CORESET_HOLDOUT = 4
+# Where the final pool is saved for solve.py
+POOL_FILE = "results/pool.txt"
+# Port of the HTTP endpoint serving live metrics (None to disable, e.g. 8000) and JSON snapshot of the metrics
+METRICS_PORT = None
+METRICS_FILE = "results/metrics.json"
+METRICS_INTERVAL = 60
+
+def print_pool(metagrammar, pool):
+    # Only prints, the driver saves the pool to POOL_FILE (see save_pool)
+    for [candidate, score, num_unsolved, num_solved] in pool:
+        print(metagrammar.to_string(candidate), score, num_unsolved, num_solved)
 
-def rand_bool_list(x, y):
-    ret = []
-    for i in range(x):
-        ret.append(random.choices([True, False], k = y))
-    return ret
-
-def print_pool(pool):
-    for [rules, score, num_unsolved, num_solved] in pool:
-        s = ""
-        for row in rules:
-            for v in row:
-                s += str(int(v))
-            s += " "
-        print(s, score, num_unsolved, num_solved)
-
-
-def mutate(ind1, ind2):
-    new_ind = []
-    for i in range(len(ind1)):
-        new_ind.append([])
-        for j in range(len(ind1[0])):
-            new_ind[i] += random.choices([ind1[i][j], ind2[i][j], True, False], weights=[4, 4, 1, 1])
-
-    return new_ind
 
 if __name__ == "__main__":
     print("> Starting Program.")
@@ -58,56 +84,26 @@ if __name__ == "__main__":
     # p.read_sygus_problem("benchmarks/lib/General_Track/bv-conditional-inverses/", "find_inv_bvsge_bvadd_4bit.sl")
     # print(p)
 
-    # Change to BitVec of all types
-    r = Rule("BitVec", [create_symbol("_"), create_symbol("BitVec"), 4], lambda x: create_symbol("#x0"))
-    r.add_subrule(lambda x: [create_symbol("BitVec0")])
-    r.add_subrule(lambda x: [create_symbol("BitVec1")])
-    r.add_subrule(lambda x: [create_symbol("BitVec2")])
-
-    combinations1 = [
-        [Symbol("BitVec0"),
-         Symbol("BitVec1"),
-         Symbol("BitVec2")]
-    ]
-
-    combinations2 = [
-        [Symbol("BitVec0"), Symbol("BitVec0")],
-        [Symbol("BitVec0"), Symbol("BitVec1")],
-        [Symbol("BitVec0"), Symbol("BitVec2")],
-        [Symbol("BitVec1"), Symbol("BitVec0")],
-        [Symbol("BitVec1"), Symbol("BitVec1")],
-        [Symbol("BitVec1"), Symbol("BitVec2")],
-        [Symbol("BitVec2"), Symbol("BitVec0")],
-        [Symbol("BitVec2"), Symbol("BitVec1")],
-        [Symbol("BitVec2"), Symbol("BitVec2")]
-    ]
-    for a in combinations1:
-        r.add_subrule(lambda x: [[Symbol("bvneg"), a]])
-        r.add_subrule(lambda x: [[Symbol("bvnot"), a]])
-
-    for a, b in combinations2:
-        r.add_subrule(lambda x: [[Symbol("bvadd"), a, b]])
-        r.add_subrule(lambda x: [[Symbol("bvsub"), a, b]])
-        r.add_subrule(lambda x: [[Symbol("bvand"), a, b]])
-        r.add_subrule(lambda x: [[Symbol("bvadd"), a, b]])
-        r.add_subrule(lambda x: [[Symbol("bvlshr"), a, b]])
-        r.add_subrule(lambda x: [[Symbol("bvor"), a, b]])
-        r.add_subrule(lambda x: [[Symbol("bvshl"), a, b]])
-
-
-    r.add_subrule(lambda x: [create_symbol(c) for c in x.get_constants()])
-    r.add_subrule(lambda x: [create_symbol(v) for v in x.get_variables()])
+    # Change to BitVec of all types, see rulespec.py for the format of the rule
+    r = load_rule("rules/bitvec.json")
 
     # Set up metagrammar and add the generated bitvector rules
-    best_str = "0" * 210
+    best_str = "0" * r.get_length()
     best_score = float("inf")
     best_unsolved = float("inf")
     best_solved = 0
     r.from_string(best_str)
 
-    m = Metagrammar()
+    m = Metagrammar(delivery=DELIVERY_MODE, memory_limit=MEMORY_LIMIT, cpu_limit=CPU_LIMIT, wall_limit=WALL_LIMIT,
+                    pin_cores=PIN_CORES, prune_operators=PRUNE_OPERATORS,
+                    solver_options=default_options() if SEARCH_SOLVER_OPTIONS else None)
     m.add_rule(r)
 
+    # Serve metrics at http://127.0.0.1:METRICS_PORT/metrics if set and snapshot them to METRICS_FILE
+    if METRICS_PORT:
+        start_server(m.metrics, METRICS_PORT)
+    start_snapshots(m.metrics, METRICS_FILE, METRICS_INTERVAL)
+
 
     # Get all problem files from the directory of problems.
     problem_dir = "benchmarks/lib/General_Track/bv-conditional-inverses/"
@@ -117,50 +113,64 @@ if __name__ == "__main__":
     train_problems, test_problems = all_problems[:len(all_problems)//2], all_problems[len(all_problems)//2:]
     assert(len(test_problems) + len(train_problems) == len(all_problems))
 
+    if COMPACT_CORPUS:
+        corpus = CompactCorpus.create(problem_dir, all_problems)
+        # Removed however the program exits, islands are forked and do not run it
+        atexit.register(corpus.unlink)
+        m.use_corpus(corpus)
+        print("[DEBUG] Corpus: ", corpus.filename, " | Problems: ", len(corpus), " | Bytes: ", len(corpus.buffer))
+
     # print("Total Number of Test Files: ", len(all_problems))
     # print("Base Case (All): ", m.base_score(problem_dir, all_problems))
     # print("Base Case (Test): ", m.base_score(problem_dir, test_problems))
     # print("Base Case (Train): ", m.base_score(problem_dir, train_problems))
 
-    pool = []
-    for individual in range(5):
-        new_rules = rand_bool_list(NUM_NONTERMINALS, NUM_SUBRULES)
-        r.set_active_rules(new_rules)
-        new_score, num_unsolved, num_solved = m.score(problem_dir, train_problems)
-        pool.append([new_rules, new_score, num_unsolved, num_solved])
-
-    pool.sort(reverse=False, key=lambda x: x[1])
-    print_pool(pool)
+    if PIN_CORES:
+        # Times that differ by less than the noise between runs of the same problem are not meaningful
+        print("[DEBUG] Calibration: ", calibrate(m, problem_dir, train_problems[0]))
+
+    train_weights = None
+    if CORESET_SIZE:
+        coreset = Coreset(m, problem_dir, train_problems, size=CORESET_SIZE).build(
+            [rand_candidate(m) for _ in range(CORESET_CANDIDATES)],
+            [rand_candidate(m) for _ in range(CORESET_HOLDOUT)])
+        print("[DEBUG] Coreset (Held-out Pearson, Held-out Spearman, Time Fraction): ", coreset["pearson"],
+              coreset["spearman"], coreset["time_fraction"])
+        train_problems, train_weights = coreset["problems"], coreset["weights"]
+
+    if NUM_ISLANDS > 1:
+        islands = IslandModel(m, problem_dir, train_problems, num_islands=NUM_ISLANDS, population_size=POPULATION_SIZE,
+                              migration_interval=MIGRATION_INTERVAL, weights=train_weights)
+        pool = islands.run(NUM_EPOCHS)
+        save_pool(m, pool, POOL_FILE)
+        for [rules, score, num_unsolved, num_solved] in pool[:POPULATION_SIZE]:
+            print(m.to_string(rules), score, num_unsolved, num_solved)
+            m.set_active_rules(rules)
+            print("[DEBUG] Score on Test Set: ", m.score(problem_dir, test_problems))
+        m.metrics.write_snapshot(METRICS_FILE)
+        print("> Ending Program.")
+        sys.exit()
+
+    # Each batch after the first one (the random initial population) is a generation
+    opt = GeneticOptimizer(m, problem_dir, train_problems, population_size=POPULATION_SIZE,
+                           batch_size=POPULATION_SIZE ** 2, num_workers=NUM_WORKERS, weights=train_weights)
+    opt.run(max_batches=1)
+    print_pool(m, opt.get_pool())
 
     for epoch in range(NUM_EPOCHS):
     # for epoch in range(1):
         print("EPOCH: ", epoch)
-        # At each epoch, take each combination and add to new pool
-
-        for i in range(5):
-            for j in range(5):
-
-                # Mutate
-                new_ind = mutate(pool[i][0], pool[j][0])
-                r.set_active_rules(new_ind)
-                new_score, num_unsolved, num_solved = m.score(problem_dir, train_problems)
-                pool.append([new_ind, new_score, num_unsolved, num_solved])
-
-
-        # Take only the best 5 from that pool
-        pool.sort(reverse=False, key=lambda x: x[1])
-        pool = pool[:5]
-        print_pool(pool)
+        opt.run(max_batches=1)
+        print_pool(m, opt.get_pool())
+        print("[DEBUG] I/O (Problems, Total Seconds, Seconds per Problem): ", m.get_io_stats())
+        print("[DEBUG] Result Cache (Hits, Misses): ", m.get_cache_stats())
 
 
-    for [rules, score, num_unsolved, num_solved] in pool:
-        s = ""
-        for row in rules:
-            for v in row:
-                s += str(int(v))
-            s += " "
-        print(s, score, num_unsolved, num_solved)
-        r.set_active_rules(rules)
+    pool = opt.get_pool()
+    save_pool(m, pool, POOL_FILE)
+    for [candidate, score, num_unsolved, num_solved] in pool:
+        print(m.to_string(candidate), score, num_unsolved, num_solved)
+        m.set_active_rules(candidate)
         print("[DEBUG] Score on Test Set: ", m.score(problem_dir, test_problems))
 
 
@@ -173,5 +183,6 @@ if __name__ == "__main__":
     # r1.add_subrule(lambda x: [create_symbol(v) for v in x.get_variables()])
 
 
+    m.metrics.write_snapshot(METRICS_FILE)
     print("> Ending Program.")
 
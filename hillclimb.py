@@ -0,0 +1,62 @@
+from metagrammar import Metagrammar
+from optimizer import Optimizer
+
+
+class HillClimber(Optimizer):
+    """
+    A HillClimber searches over the active rules of a Metagrammar. Each batch is made of
+    neighbors of the incumbent, each with num_flips random entries of its own copy of the
+    active_rules matrices flipped (see Optimizer.neighbor), which are scored concurrently.
+    It then moves to the best neighbor that is at least as good as the incumbent (both a
+    lower or equal score and no more unsolved problems). The incumbent itself is never
+    modified, so rejected neighbors are simply dropped. The first batch also scores the
+    starting candidate. The best candidate so far (see Optimizer) is the incumbent.
+
+    A candidate is a list of active_rules matrices, one per rule of the metagrammar,
+    followed by its solver options if the metagrammar has any (see solveroptions.py), in
+    which case the options of neighbors are mutated as well.
+    """
+
+    def __init__(
+        self,
+        metagrammar: Metagrammar,
+        problem_dir: str,
+        problems: list,
+        num_flips: int = 5,
+        **kwargs,
+    ):
+        """
+        Creates a HillClimber starting from the current active rules of metagrammar. See
+        Optimizer for the other arguments, e.g. batch_size is the number of neighbors of
+        each step.
+        """
+        super().__init__(metagrammar, problem_dir, problems, **kwargs)
+        self.num_flips = num_flips
+
+        # Incumbent candidate and its (score, num_unsolved, num_solved), None until scored
+        self.incumbent = self.copy_candidate(metagrammar.get_candidate())
+        self.incumbent_result = None
+
+
+    def ask(self, n: int) -> list:
+        ret = [] if self.incumbent_result is not None else [self.incumbent]
+        return ret + [self.neighbor(self.incumbent, self.num_flips) for _ in range(n - len(ret))]
+
+
+    def tell(
+        self,
+        candidates: list,
+        results: list,
+    ):
+        # Note: best is the incumbent, so it is only updated under the acceptance rule
+        for candidate, result in zip(candidates, results):
+            if self.incumbent_result is None and candidate is self.incumbent:
+                self.incumbent_result = result
+        accepted = [(candidate, result) for candidate, result in zip(candidates, results)
+                    if result[0] <= self.incumbent_result[0] and result[1] <= self.incumbent_result[1]]
+        if not accepted:
+            return
+        self.incumbent, self.incumbent_result = min(accepted, key=lambda x: self.get_key(x[1]))
+        self.best = [self.incumbent] + list(self.incumbent_result)
+        self.metagrammar.metrics.record_best(self.best[1])
+        print("[DEBUG]: Updated!")
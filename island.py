@@ -0,0 +1,141 @@
+import multiprocessing
+import queue
+import random
+from metagrammar import Metagrammar
+from optimizer import GeneticOptimizer
+
+
+class IslandModel:
+    """
+    An IslandModel runs several independent populations (islands) of the genetic algorithm
+    (see GeneticOptimizer), each in its own process with its own random seed. Every
+    migration_interval epochs, each island sends copies of its num_migrants best
+    individuals to the next island in a ring, which keeps the islands diverse while they
+    exchange good solutions.
+
+    An individual is a list of active_rules matrices, one per rule of the metagrammar
+    (followed by solver options if the metagrammar has any, see solveroptions.py), and a
+    pool is a list of [individual, score, num_unsolved, num_solved] sorted by score.
+    """
+
+    def __init__(
+        self,
+        metagrammar: Metagrammar,
+        problem_dir: str,
+        problems: list,
+        num_islands: int = 4,
+        population_size: int = 5,
+        migration_interval: int = 2,
+        num_migrants: int = 1,
+        seed: int = 1,
+        weights: list = None,
+        migration_timeout: float = 3600,
+        poll_interval: float = 5,
+    ):
+        """
+        Creates an IslandModel over metagrammar. Island i seeds its random number generator
+        with seed + i. weights are the weights of the problems in the score (see
+        Metagrammar.score). An island waits at most migration_timeout seconds for its
+        migrants before going on without them, and the islands are checked for failures
+        every poll_interval seconds while waiting for their results.
+        """
+        self.metagrammar = metagrammar
+        self.problem_dir = problem_dir
+        self.problems = problems
+        self.num_islands = num_islands
+        self.population_size = population_size
+        self.migration_interval = migration_interval
+        self.num_migrants = num_migrants
+        self.seed = seed
+        self.weights = weights
+        self.migration_timeout = migration_timeout
+        self.poll_interval = poll_interval
+
+
+    def run(self, num_epochs: int) -> list:
+        """
+        Evolves every island for num_epochs epochs and returns the final pools of all of
+        the islands merged into one pool, without isomorphic duplicates
+        """
+        # Note: fork lets the islands inherit the metagrammar without pickling its subrules
+        ctx = multiprocessing.get_context("fork")
+        inboxes = [ctx.Queue() for _ in range(self.num_islands)]
+        results = ctx.Queue()
+        if self.metagrammar.core_pool:
+            # The islands pin their solvers to cores of the same pool
+            self.metagrammar.core_pool.share(ctx)
+
+        islands = []
+        for i in range(self.num_islands):
+            p = ctx.Process(target=self.run_island,
+                            args=(i, num_epochs, inboxes[i], inboxes[(i + 1) % self.num_islands], results))
+            p.start()
+            islands.append(p)
+
+        pool = []
+        num_results = 0
+        try:
+            while num_results < self.num_islands:
+                try:
+                    pool += results.get(timeout=self.poll_interval)
+                    num_results += 1
+                    continue
+                except queue.Empty:
+                    pass
+                # An island that exits puts its pool first, so a failed island never will
+                failed = [i for i, p in enumerate(islands) if p.exitcode not in (None, 0)]
+                if failed or all(not p.is_alive() for p in islands):
+                    raise RuntimeError("Islands failed: " + str([(i, islands[i].exitcode) for i in failed]))
+        finally:
+            for p in islands:
+                if p.is_alive() and num_results < self.num_islands:
+                    p.terminate()
+                p.join()
+
+        # Migrants end up in the pools of several islands, keep isomorphic individuals once
+        unique = {}
+        for individual in pool:
+            unique.setdefault(self.metagrammar.canonical_hash(individual[0]), individual)
+        pool = list(unique.values())
+        pool.sort(reverse=False, key=lambda x: x[1])
+        # Note: the islands count their metrics in their own processes
+        if pool:
+            self.metagrammar.metrics.record_best(pool[0][1])
+        return pool
+
+
+    def run_island(
+        self,
+        index: int,
+        num_epochs: int,
+        inbox,
+        outbox,
+        results,
+    ):
+        """
+        Evolves a single island, exchanging migrants through inbox and outbox, and puts its
+        final pool in results
+        """
+        # The islands run in parallel, so each scores its individuals one at a time, a
+        # generation (population_size ** 2 children) per batch
+        opt = GeneticOptimizer(self.metagrammar, self.problem_dir, self.problems,
+                               population_size=self.population_size, batch_size=self.population_size ** 2,
+                               num_workers=1, rng=random.Random(self.seed + index), weights=self.weights)
+        # The first batch is the random initial population
+        opt.run(max_batches=1)
+
+        for epoch in range(num_epochs):
+            print("[DEBUG] Island: ", index, " | Epoch: ", epoch, " | Best Score: ", opt.best[1])
+            opt.run(max_batches=1)
+
+            if (epoch + 1) % self.migration_interval == 0 and self.num_islands > 1:
+                outbox.put(opt.get_pool()[:self.num_migrants])
+                try:
+                    migrants = inbox.get(timeout=self.migration_timeout)
+                except queue.Empty:
+                    print("[DEBUG] Island: ", index, " | No migrants after ", self.migration_timeout, "s, going on")
+                    migrants = []
+                # Migrants were scored on the same problems by the sending island
+                opt.add(migrants)
+
+        results.put(opt.get_pool())
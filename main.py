@@ -8,6 +8,14 @@ from sexp_utils import *
 from metagrammar import Metagrammar
 from sygusproblem import SyGuSProblem
 from rule import Rule
+from rulespec import load_rule
+from timing import calibrate
+from solve import save_pool
+from metrics import start_server, start_snapshots
+from solveroptions import default_options
+from coreset import Coreset
+from candidates import rand_candidate
+from search import create_optimizer
 
 
 """
@@ -20,6 +28,40 @@ Things to do:
 6. Profit
 """
 
+# How generated problems are handed to CVC5: "disk", "memfd" or "tmpfs"
+DELIVERY_MODE = "disk"
+# Limits of each CVC5 run: address space in MB, CPU seconds and wall-clock seconds (None for no limit)
+MEMORY_LIMIT = None
+CPU_LIMIT = None
+WALL_LIMIT = 60
+# Pin each CVC5 run to its own physical core and check timing noise before searching
+PIN_CORES = False
+# Leave operators that a problem never uses out of its grammar
+PRUNE_OPERATORS = False
+# Number of candidates (e.g. neighbors of the hill climber) evaluated concurrently in each batch
+NUM_NEIGHBORS = 4
+# Search with the plain hill climber ("hillclimb"), tabu search ("tabu") or any other optimizer
+# of search.py ("genetic", "annealing" or "bayes")
+OPTIMIZER = "hillclimb"
+# Stop after NUM_BATCHES batches or once SOLVER_BUDGET solver seconds are spent (None for no
+# limit), the best score versus solver seconds is written to CURVE_FILE
+NUM_BATCHES = 100
+SOLVER_BUDGET = None
+CURVE_FILE = "results/curve.csv"
+# Search CVC5 options (see solveroptions.py) along with the active rules
+SEARCH_SOLVER_OPTIONS = False
+# Train on a weighted coreset of CORESET_SIZE problems (None for all training problems), picked
+# from the scores of CORESET_CANDIDATES random candidates and checked on CORESET_HOLDOUT other
+# random candidates (see coreset.py)
+CORESET_SIZE = None
+CORESET_CANDIDATES = 8
+CORESET_HOLDOUT = 4
+# Where the best candidate is saved for solve.py
+POOL_FILE = "results/pool.txt"
+# Port of the HTTP endpoint serving live metrics (None to disable, e.g. 8000) and JSON snapshot of the metrics
+METRICS_PORT = None
+METRICS_FILE = "results/metrics.json"
+METRICS_INTERVAL = 60
 
 if __name__ == "__main__":
     print("> Starting Program.")
@@ -30,56 +72,22 @@ if __name__ == "__main__":
     # p.read_sygus_problem("benchmarks/lib/General_Track/bv-conditional-inverses/", "find_inv_bvsge_bvadd_4bit.sl")
     # print(p)
 
-    # Change to BitVec of all types
-    r = Rule("BitVec", [create_symbol("_"), create_symbol("BitVec"), 4], lambda x: create_symbol("#x0"))
-    r.add_subrule(lambda x: [create_symbol("BitVec0")])
-    r.add_subrule(lambda x: [create_symbol("BitVec1")])
-    r.add_subrule(lambda x: [create_symbol("BitVec2")])
-
-    combinations1 = [
-        [Symbol("BitVec0"),
-         Symbol("BitVec1"),
-         Symbol("BitVec2")]
-    ]
-
-    combinations2 = [
-        [Symbol("BitVec0"), Symbol("BitVec0")],
-        [Symbol("BitVec0"), Symbol("BitVec1")],
-        [Symbol("BitVec0"), Symbol("BitVec2")],
-        [Symbol("BitVec1"), Symbol("BitVec0")],
-        [Symbol("BitVec1"), Symbol("BitVec1")],
-        [Symbol("BitVec1"), Symbol("BitVec2")],
-        [Symbol("BitVec2"), Symbol("BitVec0")],
-        [Symbol("BitVec2"), Symbol("BitVec1")],
-        [Symbol("BitVec2"), Symbol("BitVec2")]
-    ]
-    for a in combinations1:
-        r.add_subrule(lambda x: [[Symbol("bvneg"), a]])
-        r.add_subrule(lambda x: [[Symbol("bvnot"), a]])
-
-    for a, b in combinations2:
-        r.add_subrule(lambda x: [[Symbol("bvadd"), a, b]])
-        r.add_subrule(lambda x: [[Symbol("bvsub"), a, b]])
-        r.add_subrule(lambda x: [[Symbol("bvand"), a, b]])
-        r.add_subrule(lambda x: [[Symbol("bvadd"), a, b]])
-        r.add_subrule(lambda x: [[Symbol("bvlshr"), a, b]])
-        r.add_subrule(lambda x: [[Symbol("bvor"), a, b]])
-        r.add_subrule(lambda x: [[Symbol("bvshl"), a, b]])
-
-
-    r.add_subrule(lambda x: [create_symbol(c) for c in x.get_constants()])
-    r.add_subrule(lambda x: [create_symbol(v) for v in x.get_variables()])
+    # Change to BitVec of all types, see rulespec.py for the format of the rule
+    r = load_rule("rules/bitvec.json")
 
     # Set up metagrammar and add the generated bitvector rules
-    best_str = "0" * 210
-    best_score = float("inf")
-    best_unsolved = float("inf")
-    best_solved = 0
-    r.from_string(best_str)
+    r.from_string("0" * r.get_length())
 
-    m = Metagrammar()
+    m = Metagrammar(delivery=DELIVERY_MODE, memory_limit=MEMORY_LIMIT, cpu_limit=CPU_LIMIT, wall_limit=WALL_LIMIT,
+                    pin_cores=PIN_CORES, prune_operators=PRUNE_OPERATORS,
+                    solver_options=default_options() if SEARCH_SOLVER_OPTIONS else None)
     m.add_rule(r)
 
+    # Serve metrics at http://127.0.0.1:METRICS_PORT/metrics if set and snapshot them to METRICS_FILE
+    if METRICS_PORT:
+        start_server(m.metrics, METRICS_PORT)
+    start_snapshots(m.metrics, METRICS_FILE, METRICS_INTERVAL)
+
 
     # Get all problem files from the directory of problems.
     problem_dir = "benchmarks/lib/General_Track/bv-conditional-inverses/"
@@ -95,30 +103,32 @@ if __name__ == "__main__":
     print("Base Case (Train): ", m.base_score(problem_dir, train_problems))
 
 
-    print("[DEBUG] Base String: ", r.to_string())
-    for i in range(100):
-        print("Iteration: ", i)
-        # TODO: We will need to rewrite all of the nonterminals if there are multiple
-        # Try randomly swapping value, if better or equal score, then keep
-        for i in range(5):
-            idxi = random.randint(0, r.get_num_nonterminals()-1)
-            idxj = random.randint(0, r.get_num_subrules()-1)
-            # TODO: For now we just flip the active status
-            r.set_active_rule(idxi, idxj, not r.get_active_rule(idxi, idxj))
-    
-        new_score, num_unsolved, num_solved = m.score(problem_dir, train_problems)
-        print("[DEBUG] Current String: ", r.to_string())
-        print("[DEBUG] Best Score: ", best_score, " | Best Unsolved: ", best_unsolved, " | Best Solved: ", best_solved, 
-            " | New Score: ", new_score, " | Number Unsolved: ", num_unsolved, "| Number Solved:", num_solved)
-        if new_score <= best_score and num_unsolved <= best_unsolved:
-            best_str = r.to_string()
-            best_score = new_score
-            best_unsolved = num_unsolved
-            best_solved = num_solved
-            print("[DEBUG]: Updated!")
-
-    print("[DEBUG] Best String: ", best_str, " | Best Score:", best_score)
-    print("[DEBUG] Best Num Unsolved: ", num_unsolved, " | Best Score:", num_solved)
+    if PIN_CORES:
+        # Times that differ by less than the noise between runs of the same problem are not meaningful
+        print("[DEBUG] Calibration: ", calibrate(m, problem_dir, train_problems[0]))
+
+    train_weights = None
+    if CORESET_SIZE:
+        coreset = Coreset(m, problem_dir, train_problems, size=CORESET_SIZE).build(
+            [rand_candidate(m) for _ in range(CORESET_CANDIDATES)],
+            [rand_candidate(m) for _ in range(CORESET_HOLDOUT)])
+        print("[DEBUG] Coreset (Held-out Pearson, Held-out Spearman, Time Fraction): ", coreset["pearson"],
+              coreset["spearman"], coreset["time_fraction"])
+        train_problems, train_weights = coreset["problems"], coreset["weights"]
+
+    # Evaluate NUM_NEIGHBORS candidates at once in each batch
+    print("[DEBUG] Base String: ", m.to_string())
+    opt = create_optimizer(OPTIMIZER, m, problem_dir, train_problems, batch_size=NUM_NEIGHBORS,
+                           weights=train_weights)
+    best_rules, best_score, best_unsolved, best_solved = opt.run(SOLVER_BUDGET, max_batches=NUM_BATCHES)
+    opt.write_curve(CURVE_FILE)
+    m.set_active_rules(best_rules)
+    save_pool(m, [[best_rules, best_score, best_unsolved, best_solved]], POOL_FILE)
+
+    print("[DEBUG] I/O (Problems, Total Seconds, Seconds per Problem): ", m.get_io_stats())
+    print("[DEBUG] Result Cache (Hits, Misses): ", m.get_cache_stats())
+    print("[DEBUG] Best String: ", m.to_string(), " | Best Score:", best_score)
+    print("[DEBUG] Best Num Unsolved: ", best_unsolved, " | Best Num Solved:", best_solved)
     print("[DEBUG] Score on Test Set: ", m.score(problem_dir, test_problems))
 
     # test = ""
@@ -137,5 +147,6 @@ if __name__ == "__main__":
     # r1.add_subrule(lambda x: [create_symbol(v) for v in x.get_variables()])
 
 
+    m.metrics.write_snapshot(METRICS_FILE)
     print("> Ending Program.")
 
@@ -1,9 +1,21 @@
 import subprocess
 import re
+import os
+import signal
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
 from os import listdir
 from os.path import isfile, join
 from pathlib import Path
-from sygusproblem import SyGuSProblem
+from sygusproblem import SyGuSProblem, LazySyGuSProblem
+from delivery import create_delivery
+from rulespec import instantiate_rule, rule_supports_logic
+from timing import CorePool
+from metrics import Metrics
+from solveroptions import options_to_args, options_to_string, options_from_string
 from sexp_utils import *
 
 
@@ -15,11 +27,80 @@ class Metagrammar:
     problem.
     """
 
-    def __init__(self):
+    def __init__(
+        self,
+        delivery: str = "disk",
+        memory_limit: int = None,
+        cpu_limit: int = None,
+        wall_limit: float = 60,
+        time_source: str = "cvc5",
+        pin_cores: bool = False,
+        prune_operators: bool = False,
+        solver_options: dict = None,
+        max_cached_results: int = 100000,
+    ):
         """
-        Create a metagrammar with no rules initially
+        Create a metagrammar with no rules initially. delivery selects how generated
+        problems are handed to the solver when scoring: "disk" (written to results/),
+        "memfd" (anonymous memory files) or "tmpfs" (temporary files in /dev/shm).
+        Each solver run is limited to memory_limit MB of address space, cpu_limit seconds
+        of CPU time and wall_limit seconds of wall-clock time (None for no limit), and is
+        scored with the time reported by CVC5 or, if time_source is "cpu", with the
+        measured CPU time. If pin_cores is set, each solver run is pinned to a dedicated
+        physical core and no more solvers than physical cores run at once (see timing.py).
+        If prune_operators is set, operator subrules are left out of the grammar of
+        problems that never use their operator (see prune_active_rules). solver_options
+        are the options passed to CVC5 (see solveroptions.py), which are searched along
+        with the active rules if given. At most max_cached_results solver records are kept
+        in the result cache (None for no limit), the least recently used are dropped first.
         """
         self.rules = []
+        self.delivery = create_delivery(delivery)
+        self.memory_limit = memory_limit
+        self.cpu_limit = cpu_limit
+        self.wall_limit = wall_limit
+        self.time_source = time_source
+        self.core_pool = CorePool() if pin_cores else None
+        self.prune_operators = prune_operators
+        self.solver_options = dict(solver_options or {})
+
+        # Parsed problems by path and (result, time_to_solve) by fingerprint of the generated
+        # problem (see get_fingerprint). Copies of the metagrammar share these.
+        self.problem_cache = {}
+        self.result_cache = OrderedDict()
+        self.max_cached_results = max_cached_results
+
+        # Futures of the records being computed by a thread by fingerprint, so that threads
+        # scoring the same generated problem run the solver once (see score_problems)
+        self.pending_results = {}
+
+        # Paths of the problems no rule applies to, reported once (see score_problems)
+        self.unsupported_problems = set()
+
+        # Rules instantiated for a given sort (see get_rule_instance)
+        self.instance_cache = {}
+        self.cache_stats = {"hits": 0, "misses": 0}
+        self.cache_lock = threading.Lock()
+
+        # Counters of solver runs, evaluations and cache lookups, shared with copies (see metrics.py)
+        self.metrics = Metrics()
+
+
+    def __getstate__(self):
+        """
+        Pickles the metagrammar without its lock and pending results so it can be sent to
+        other processes
+        """
+        state = self.__dict__.copy()
+        del state["cache_lock"]
+        del state["pending_results"]
+        return state
+
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.cache_lock = threading.Lock()
+        self.pending_results = {}
 
 
     def generate_grammar_from_rules(
@@ -28,29 +109,71 @@ class Metagrammar:
     ) -> list:
         """
         Generates a grammar from the rules in the metagrammar based on the the
-        problem and returns the grammar as a list
+        problem and returns the grammar as a list. Each rule that supports the logic of
+        the problem is instantiated for the return sort of the problem (see
+        rulespec.instantiate_rule), the nonterminals of the first one starting with name0,
+        the start symbol. Raises ValueError if no rule applies to the problem.
         """
-        ret = []
-        problem_ret_type = problem.get_return_type()
-        nonterminals_list = []
-
-        for r in self.rules:
-            # Insert the rule into the right plan in the list of terminals
-            rule_type = r.get_nonterminal_type()
-            if rule_type == problem_ret_type:
-                # Note: Need to insert at i to ensure that name0 is first in list
-                for i in range(r.get_num_nonterminals()):
-                    nonterminals_list.insert(i, [create_symbol(r.get_name() + str(i)), rule_type])
-            else:
-                for i in range(r.get_num_nonterminals()):
-                    nonterminals_list.append([create_symbol(r.get_name() + str(i)), rule_type])
+        logic = problem.get_logic()
+        sort = problem.get_return_type()
+
+        # Note: only the return sort is instantiated, since no production of a rule refers
+        # to the nonterminals of another sort, which could not be reached from the start
+        nonterminals, productions = [], []
+        for i, r in enumerate(self.rules):
+            if not rule_supports_logic(r, logic):
+                continue
+            instance = self.get_rule_instance(i, sort)
+            if instance is None:
+                continue
+
+            for j in range(instance.get_num_nonterminals()):
+                nonterminals.append([create_symbol(instance.get_name() + str(j)), instance.get_nonterminal_type()])
 
             # Use the rule to generate grammar for that non terminal.
-            ret.append(r.generate_grammar(problem))
+            active_rules = r.get_active_rules()
+            if self.prune_operators:
+                active_rules = self.prune_active_rules(instance, active_rules, problem)
+            productions += instance.generate_grammar(problem, active_rules)
 
-        # Insert the list of nonterminals at the beginning of the list as per SyGuS format
-        ret.insert(0, nonterminals_list)
-        return ret
+        if not nonterminals:
+            raise ValueError("No rule for return type: ", export_sexp_raw(sort), " | Logic: ", logic)
+
+        # The list of nonterminals comes before the productions as per SyGuS format
+        return [nonterminals, productions]
+
+
+    def get_rule_instance(
+        self,
+        index: int,
+        sort,
+    ):
+        """
+        Gets the rule at index instantiated for sort (None if the rule does not apply to
+        sort). Instances are cached per (rule, sort) so the productions of a rule are only
+        built once per sort, no matter how many problems use it.
+        """
+        key = (index, export_sexp_raw(sort))
+        if key not in self.instance_cache:
+            self.instance_cache[key] = instantiate_rule(self.rules[index], sort)
+        return self.instance_cache[key]
+
+
+    def prune_active_rules(
+        self,
+        rule,
+        active_rules: list,
+        problem: SyGuSProblem,
+    ) -> list:
+        """
+        Returns a copy of active_rules (the matrix of rule) in which the operator subrules
+        whose operator never appears in the definitions and constraints of problem (see
+        SyGuSProblem.get_features) are inactive. This is a heuristic: it only shrinks the
+        grammar handed to the solver, the active rules being searched are not changed.
+        """
+        used = problem.get_features()["operators"]
+        keep = [key is None or key[0] == "nonterminal" or key[0] in used for key in rule.subrule_keys]
+        return [[v and k for v, k in zip(row, keep)] for row in active_rules]
 
 
     def add_rule(self, rule):
@@ -60,6 +183,141 @@ class Metagrammar:
         self.rules.append(rule)
 
 
+    def canonical_hash(
+        self,
+        active_rules: list = None,
+    ) -> str:
+        """
+        Returns a hash of the active rules of every rule in the metagrammar and its solver
+        options (or of the candidate active_rules, see split_candidate), taken in canonical
+        form (see Rule.canonicalize) so that metagrammars that only differ by a renaming of
+        nonterminals hash to the same value
+        """
+        if active_rules is None:
+            active_rules = self.get_candidate()
+        active_rules, options = self.split_candidate(active_rules)
+        h = hashlib.sha1()
+        for r, a in zip(self.rules, active_rules):
+            h.update((r.get_name() + ":" + r.to_canonical_string(a) + ";").encode())
+        if options:
+            h.update(options_to_string(options).encode())
+        return h.hexdigest()
+
+
+    def split_candidate(
+        self,
+        candidate: list,
+    ) -> (list, dict):
+        """
+        Splits a candidate, a list of active_rules matrices (one per rule) optionally
+        followed by a dictionary of solver options, into the matrices and the options (None
+        if the candidate has none)
+        """
+        n = len(self.rules)
+        assert len(candidate) in (n, n + 1), "Candidate has the wrong number of rules"
+        return candidate[:n], candidate[n] if len(candidate) > n else None
+
+
+    def get_candidate(self) -> list:
+        """
+        Returns the active_rules matrices of the rules, followed by the solver options if
+        the metagrammar has any
+        """
+        return self.get_active_rules() + ([dict(self.solver_options)] if self.solver_options else [])
+
+
+    def copy_with_active_rules(
+        self,
+        active_rules: list,
+    ):
+        """
+        Returns a copy of the metagrammar whose rules use active_rules (one matrix per
+        rule, optionally followed by solver options, see split_candidate). The copy shares
+        the subrules and delivery of this metagrammar.
+        """
+        active_rules, options = self.split_candidate(active_rules)
+        ret = self.copy_with_solver_options(self.solver_options if options is None else options)
+        ret.rules = [r.copy_with_active_rules(a) for r, a in zip(self.rules, active_rules)]
+        return ret
+
+
+    def copy_with_solver_options(
+        self,
+        solver_options: dict,
+    ):
+        """
+        Returns a copy of the metagrammar that passes solver_options to CVC5 (None for the
+        defaults of CVC5, e.g. for baselines). The copy shares the rules, caches and
+        delivery of this metagrammar.
+        """
+        # Note: not copy.copy, which goes through __getstate__ and would not share the lock
+        ret = object.__new__(type(self))
+        ret.__dict__.update(self.__dict__)
+        ret.solver_options = dict(solver_options or {})
+        return ret
+
+
+    def set_active_rules(
+        self,
+        active_rules: list,
+    ):
+        """
+        Updates the active_rules matrix of every rule, one matrix per rule, and the solver
+        options if they follow the matrices (see split_candidate)
+        """
+        active_rules, options = self.split_candidate(active_rules)
+        for r, a in zip(self.rules, active_rules):
+            r.set_active_rules(a)
+        if options is not None:
+            self.solver_options = dict(options)
+
+
+    def to_string(
+        self,
+        active_rules: list = None,
+    ) -> str:
+        """
+        Converts the active rules and solver options (or the candidate active_rules, see
+        split_candidate) to string format for easy print, with the rules separated by
+        spaces and followed by the options if any (see solveroptions.options_to_string)
+        """
+        if active_rules is None:
+            active_rules = self.get_candidate()
+        active_rules, options = self.split_candidate(active_rules)
+        ret = " ".join("".join("1" if v else "0" for row in a for v in row) for a in active_rules)
+        if options:
+            ret += " " + options_to_string(options)
+        return ret
+
+
+    def from_string(
+        self,
+        active_string: str,
+    ) -> list:
+        """
+        Parses a string produced by to_string back into a candidate (one matrix per rule,
+        followed by the solver options if the string has any) without changing the rules of
+        the metagrammar
+        """
+        parts = active_string.split()
+        assert len(parts) in (len(self.rules), len(self.rules) + 1), "String has the wrong number of rules"
+        ret = []
+        for r, s in zip(self.rules, parts):
+            assert r.get_length() == len(s), "String incorrect length"
+            n = r.get_num_subrules()
+            ret.append([[c == "1" for c in s[i * n:(i + 1) * n]] for i in range(r.get_num_nonterminals())])
+        if len(parts) > len(self.rules):
+            ret.append(options_from_string(parts[-1]))
+        return ret
+
+
+    def get_active_rules(self) -> list:
+        """
+        Returns the active_rules matrices of the rules, one matrix per rule
+        """
+        return [r.get_active_rules() for r in self.rules]
+
+
     def write_problem_with_grammar(
         self,
         problem: SyGuSProblem,
@@ -72,7 +330,7 @@ class Metagrammar:
         """
         # Generate grammmar to export
         g = self.generate_grammar_from_rules(problem)
-        data = export_sexp(problem.create_with_new_grammar(g))
+        data = problem.export_with_new_grammar(g)
         filename = dest_dir + problem_name
 
         # Create directory if path to filename does not already exist
@@ -88,24 +346,176 @@ class Metagrammar:
         use_stats: bool = True,
         timeout: int = 300,
         seed: int = 1,
+        pass_fds: tuple = (),
     ) -> (int, int):
         """
         Runs benchmarks on a SyGuS problem and return the result (either a successful 
         solve or a "timeout or fail") as well as the time to solve the problem
         """
+        record = self.run_solver(src_dir, problem_name, use_stats, timeout, seed, pass_fds)
+        return record["result"], record["time_to_solve"]
+
+
+    def run_solver(
+        self,
+        src_dir: str,
+        problem_name: str,
+        use_stats: bool = True,
+        timeout: int = 300,
+        seed: int = 1,
+        pass_fds: tuple = (),
+    ) -> dict:
+        """
+        Runs CVC5 on a SyGuS problem in its own process group, with the memory and CPU
+        limits of the metagrammar, killing the whole group if it runs for longer than
+        wall_limit seconds. Returns a record with the result, the time to solve reported by
+        CVC5 (None if it did not report one), the measured CPU time (user + system, in
+        seconds), wall-clock time (in seconds) and maximum resident set size (in KB) of the
+        solver, its return code and whether it had to be killed.
+        """
+        sh_cmd = self.get_solver_command(src_dir, problem_name, use_stats, timeout, seed)
+        if self.core_pool:
+            with self.core_pool.acquire() as core:
+                return self.wait_solver(self.start_solver(sh_cmd, pass_fds, core), core)
+        return self.wait_solver(self.start_solver(sh_cmd, pass_fds))
+
+
+    def get_solver_command(
+        self,
+        src_dir: str,
+        problem_name: str,
+        use_stats: bool = True,
+        timeout: int = 300,
+        seed: int = 1,
+    ) -> list:
+        """
+        Gets the shell command that runs CVC5 on a SyGuS problem with the solver options of
+        the metagrammar (whose seed, if any, replaces seed)
+        """
         # Construct shell command
         sh_cmd = ["cvc5"]
         if use_stats:
             sh_cmd.append("--stats")
         if timeout:
             sh_cmd.append("--tlimit=" + str(timeout)) # Timeout in MS
-        if seed:
+        if seed and "seed" not in self.solver_options:
             sh_cmd.append("--seed=" + str(seed))
+        sh_cmd += options_to_args(self.solver_options)
         sh_cmd.append(src_dir + problem_name)
+        return sh_cmd
+
+
+    def start_solver(
+        self,
+        sh_cmd: list,
+        pass_fds: tuple = (),
+        core: int = None,
+    ) -> subprocess.Popen:
+        """
+        Starts the solver command sh_cmd under the limits of the metagrammar, pinned to core
+        if given, and returns the process (see wait_solver)
+        """
+        # Run shell commmand in a new session so the solver and its children can be killed together
+        proc = subprocess.Popen(self.get_limited_command(sh_cmd), stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                                universal_newlines=True, pass_fds=pass_fds, start_new_session=True)
+        proc.start_time = time.perf_counter()
+        self.metrics.add("running_solvers", 1)
+        # Note: affinity is set from the parent rather than in a preexec_fn, which is not
+        # safe to use when scoring from several threads
+        if core is not None:
+            os.sched_setaffinity(proc.pid, {core})
+        return proc
+
+
+    def get_limited_command(self, sh_cmd: list) -> list:
+        """
+        Wraps sh_cmd in a shell that sets the memory and CPU limits of the metagrammar on
+        itself and then execs sh_cmd, so the solver is under its limits from its first
+        instruction (and keeps the pid of the process started)
+        """
+        limits = []
+        if self.memory_limit:
+            # ulimit -v is in KB
+            limits.append("ulimit -v " + str(self.memory_limit * 1024))
+        if self.cpu_limit:
+            # SIGXCPU at the soft limit, SIGKILL one second later at the hard limit
+            limits.append("ulimit -S -t " + str(self.cpu_limit))
+            limits.append("ulimit -H -t " + str(self.cpu_limit + 1))
+        if not limits:
+            return sh_cmd
+        return ["/bin/sh", "-c", " && ".join(limits) + ' && exec "$@"', "sh"] + sh_cmd
 
-        # Run shell commmand
-        output = subprocess.run(sh_cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, universal_newlines=True)
-        output = output.stdout.strip("\n")
+
+    @staticmethod
+    def kill_solver(proc: subprocess.Popen):
+        """
+        Kills a solver started with start_solver along with any process it started
+        """
+        try:
+            os.killpg(proc.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+
+
+    def wait_solver(
+        self,
+        proc: subprocess.Popen,
+        core: int = None,
+    ) -> dict:
+        """
+        Waits for a solver started with start_solver, killing it once it runs for longer
+        than wall_limit seconds, and returns its record (see run_solver)
+        """
+        killed = threading.Event()
+        def kill_group():
+            killed.set()
+            self.kill_solver(proc)
+        timer = threading.Timer(self.wall_limit, kill_group) if self.wall_limit else None
+        if timer:
+            timer.start()
+        try:
+            output = proc.stdout.read()
+        finally:
+            if timer:
+                timer.cancel()
+            proc.stdout.close()
+
+        # Reap the solver ourselves to get its resource usage
+        _, status, usage = os.wait4(proc.pid, 0)
+        proc.returncode = os.waitstatus_to_exitcode(status)
+        wall_time = time.perf_counter() - proc.start_time
+
+        result, time_to_solve = self.parse_solver_output(output)
+        record = {
+            "result": result,
+            "time_to_solve": time_to_solve,
+            "cpu_time": usage.ru_utime + usage.ru_stime,
+            "wall_time": wall_time,
+            "max_rss": usage.ru_maxrss,
+            "returncode": proc.returncode,
+            "killed": killed.is_set(),
+            "core": core,
+        }
+
+        self.metrics.add("running_solvers", -1)
+        self.metrics.inc("solver_runs_total")
+        self.metrics.inc("solver_cpu_seconds_total", record["cpu_time"])
+        self.metrics.observe("solver_wall_seconds", wall_time)
+        if result == "timeout or fail":
+            self.metrics.inc("solver_timeouts_total")
+        if record["killed"]:
+            self.metrics.inc("solver_kills_total")
+        return record
+
+
+    @staticmethod
+    def parse_solver_output(output: str) -> (str, int):
+        """
+        Parses the output of CVC5 and returns the result (either a successful solve or a
+        "timeout or fail") as well as the time to solve the problem in ms (None if the
+        solver did not report it, e.g. because it was killed)
+        """
+        output = output.strip("\n")
 
         # Check if solved problem
         pattern = "(define-fun .*)"
@@ -120,15 +530,102 @@ class Metagrammar:
         pattern = "global::totalTime = (.*)ms"
         compiled = re.compile(pattern)
         ret = compiled.search(output)
-        time_to_solve = ret.group(1).strip()
+        time_to_solve = int(ret.group(1).strip()) if ret else None
 
         return result, time_to_solve
 
 
+    def score_problems(
+        self,
+        problem_dir: str,
+        problems: list,
+    ) -> list:
+        """
+        Applies the metagrammar to each of the problems, runs the solver on it and returns
+        the record of each run (see run_solver) with the name of the problem added. Problems
+        no rule applies to are reported once and get an unsolved record.
+        """
+        records = []
+        # For each of the problems, deliver the problem with the new grammar to the solver (by
+        # default in "results/test.sl") then run the solver to retrieve the time to
+        # solve/whether it is solvable
+        # If a problem ends up with the same grammar as in a previous call, its result is reused
+        for fname in problems:
+            p = self.get_problem(problem_dir, fname)
+            try:
+                grammar = export_grammar(self.generate_grammar_from_rules(p))
+            except ValueError as e:
+                # No rule applies to the problem, it counts as unsolved without running the solver
+                if problem_dir + fname not in self.unsupported_problems:
+                    self.unsupported_problems.add(problem_dir + fname)
+                    print("[DEBUG] Unsupported problem: ", problem_dir + fname, " | Error: ", e)
+                records.append({"result": "timeout or fail", "time_to_solve": None, "cpu_time": 0.0,
+                                "problem": fname, "unsupported": True})
+                continue
+            fingerprint = self.get_fingerprint(problem_dir, fname, grammar)
+
+            with self.cache_lock:
+                record = self.result_cache.get(fingerprint)
+                pending = None
+                if record is not None:
+                    self.result_cache.move_to_end(fingerprint)
+                elif fingerprint in self.pending_results:
+                    pending = self.pending_results[fingerprint]
+                else:
+                    self.pending_results[fingerprint] = Future()
+
+            if record is None and pending is not None:
+                # Another thread is running the solver on the same generated problem
+                record = pending.result()
+            if record is not None:
+                with self.cache_lock:
+                    self.cache_stats["hits"] += 1
+                self.metrics.inc("cache_hits_total")
+            else:
+                try:
+                    data = p.export_with_grammar_string(grammar)
+                    with self.delivery.deliver(data, "test.sl") as (path, pass_fds):
+                        record = self.run_solver("", path, pass_fds=pass_fds)
+                    record["problem"] = fname
+                    record["solver_options"] = dict(self.solver_options)
+                    self.cache_result(fingerprint, record)
+                    self.pending_results[fingerprint].set_result(record)
+                except BaseException as e:
+                    self.pending_results[fingerprint].set_exception(e)
+                    raise
+                finally:
+                    with self.cache_lock:
+                        del self.pending_results[fingerprint]
+                with self.cache_lock:
+                    self.cache_stats["misses"] += 1
+                self.metrics.inc("cache_misses_total")
+            records.append(record)
+
+        return records
+
+
+    def cache_result(
+        self,
+        fingerprint: str,
+        record: dict,
+    ):
+        """
+        Adds the solver record of the generated problem with fingerprint to the result
+        cache, dropping the least recently used records beyond max_cached_results
+        """
+        with self.cache_lock:
+            self.result_cache[fingerprint] = record
+            self.result_cache.move_to_end(fingerprint)
+            if self.max_cached_results is not None:
+                while len(self.result_cache) > self.max_cached_results:
+                    self.result_cache.popitem(last=False)
+
+
     def score(
         self, 
         problem_dir: str, 
-        problems: list
+        problems: list,
+        weights: list = None,
     ) -> (int, int, int):
         """
         The score function receives a path to the problem directory as well as list
@@ -136,31 +633,156 @@ class Metagrammar:
         each problem and accumlates the total time to run as the score (note that 
         if the solver, CVC5, does not finish in time 600 will be added to the score).
         In addition to returning the score, the program also returns the number of 
-        unsolved problems.
+        unsolved problems. If weights are given (one per problem, e.g. from a coreset, see
+        coreset.py), each problem counts weights times in the score and in the counts.
         """
+        start = time.perf_counter()
+        ret = self.aggregate_records(self.score_problems(problem_dir, problems), weights)
+        self.metrics.inc("evaluations_total")
+        self.metrics.observe("evaluation_seconds", time.perf_counter() - start)
+        return ret
+
 
+    def aggregate_records(
+        self,
+        records: list,
+        weights: list = None,
+    ) -> (int, int, int):
+        """
+        Accumulates solver records into the score (see get_record_score), the number of
+        unsolved problems and the number of solved problems. If weights are given, each
+        record counts weights times in all three, so the counts stay comparable with the
+        score (e.g. both estimate the full set of problems a coreset stands for).
+        """
+        if weights is None:
+            weights = [1] * len(records)
         total_time_to_solve = 0
         num_unsolved = 0
         num_solved = 0
-        # For each of the problems, write the problem with the new grammar to "results/test.sl"
-        # then apply the benchmark function to retrieve the time to solve/whether it is solvable
-        for fname in problems:
-            p = SyGuSProblem(fname)
-            p.read_sygus_problem(problem_dir, fname)
-            self.write_problem_with_grammar(p, "results/", "test.sl")
-            result, time_to_solve = self.benchmark("results/", "test.sl")
-
-            if result == "timeout or fail":
-                # TODO: Can change this value to a more fitting penalty.
-                total_time_to_solve += 600
-                num_unsolved += 1
+        for record, weight in zip(records, weights):
+            total_time_to_solve += weight * self.get_record_score(record)
+            if record["result"] == "timeout or fail":
+                num_unsolved += weight
             else:
-                total_time_to_solve += int(time_to_solve)
-                num_solved += 1
+                num_solved += weight
 
         return total_time_to_solve, num_unsolved, num_solved
 
 
+    def get_record_score(self, record: dict) -> int:
+        """
+        Gets the score of a single solver record: its time (see get_record_time), or a
+        penalty of 600 if the problem was not solved
+        """
+        if record["result"] == "timeout or fail":
+            # TODO: Can change this value to a more fitting penalty.
+            return 600
+        return self.get_record_time(record)
+
+
+    def get_record_time(self, record: dict) -> int:
+        """
+        Gets the time to solve of a solver record in ms according to time_source (the time
+        reported by CVC5 if the CPU time is unknown, e.g. for the runs of a bundle)
+        """
+        if record["cpu_time"] is not None and (self.time_source == "cpu" or record["time_to_solve"] is None):
+            return int(record["cpu_time"] * 1000)
+        return record["time_to_solve"]
+
+
+    def get_problem(
+        self,
+        problem_dir: str,
+        problem_name: str,
+    ) -> LazySyGuSProblem:
+        """
+        Gets the problem problem_dir + problem_name, reading it only the first time. Only
+        the grammar changes between metagrammars, so avoid parsing the whole problem.
+        """
+        path = problem_dir + problem_name
+        if path not in self.problem_cache:
+            p = LazySyGuSProblem(problem_name)
+            p.read_sygus_problem(problem_dir, problem_name)
+            self.problem_cache[path] = p
+        return self.problem_cache[path]
+
+
+    def use_corpus(self, corpus):
+        """
+        Serves the problems of corpus, a CompactCorpus (see compact.py), from the problem
+        cache. They are pickled as references into the corpus, so processes the metagrammar
+        is sent to map its blob rather than receiving copies of the problems.
+        """
+        self.problem_cache.update(corpus.problems)
+
+
+    def get_fingerprint(
+        self,
+        problem_dir: str,
+        problem_name: str,
+        grammar: str,
+    ) -> str:
+        """
+        Gets the fingerprint of a problem with the (serialized) grammar grammar. Metagrammars
+        that generate the same grammar for a problem and use the same solver options get the
+        same result for it.
+        """
+        key = problem_dir + problem_name + "\n" + grammar + "\n" + options_to_string(self.solver_options)
+        return hashlib.sha1(key.encode()).hexdigest()
+
+
+    def get_cache_stats(self) -> (int, int):
+        """
+        Gets the number of problems whose result was reused from a previous score and the
+        number of problems that had to be solved
+        """
+        return self.cache_stats["hits"], self.cache_stats["misses"]
+
+
+    def score_candidates(
+        self,
+        problem_dir: str,
+        problems: list,
+        candidates: list,
+        num_workers: int = None,
+        weights: list = None,
+    ) -> list:
+        """
+        Scores several candidates at once, where each candidate is a list of active_rules
+        matrices (one per rule). Candidates are scored concurrently by up to num_workers
+        threads (by default one per candidate, at most one per pinned core), each on its
+        own copy of the metagrammar. Returns the (score, num_unsolved, num_solved) of each
+        candidate in order (see score for weights).
+        """
+        if not candidates:
+            return []
+        copies = [self.copy_with_active_rules(c) for c in candidates]
+        if num_workers is None:
+            num_workers = min(len(copies), len(self.core_pool)) if self.core_pool else len(copies)
+
+        # Candidates waiting for a worker and workers busy scoring a candidate
+        self.metrics.set("workers", num_workers)
+        self.metrics.add("queue_depth", len(copies))
+        def score(m):
+            self.metrics.add("queue_depth", -1)
+            self.metrics.add("busy_workers", 1)
+            try:
+                return m.score(problem_dir, problems, weights)
+            finally:
+                self.metrics.add("busy_workers", -1)
+
+        with ThreadPoolExecutor(max_workers=num_workers) as executor:
+            return list(executor.map(score, copies))
+
+
+    def get_io_stats(self) -> (int, float, float):
+        """
+        Gets the number of problems delivered to the solver while scoring, the total I/O
+        time in seconds and the average I/O time per problem
+        """
+        return self.delivery.get_io_stats()
+
+
     def base_score(
         self, 
         problem_dir: str, 
@@ -169,23 +791,10 @@ class Metagrammar:
         """
         The base_score function computes the score that the SyGuS problems would receive if
         they were run AS-IS with no metagrammar applied to the problem. This performanced
-        depends on who wrote the test and how good that original grammar is.
+        depends on who wrote the test and how good that original grammar is. CVC5 runs with
+        its default options, not with the solver options of the metagrammar.
         """
 
-        total_time_to_solve = 0
-        num_unsolved = 0
-        num_solved = 0
-        # For each of the problems, write the problem with the new grammar to "results/test.sl"
-        # then apply the benchmark function to retrieve the time to solve/whether it is solvable
-        for fname in problems:
-            result, time_to_solve = self.benchmark(problem_dir, fname)
-
-            if result == "timeout or fail":
-                # TODO: Can change this value to a more fitting penalty.
-                total_time_to_solve += 600
-                num_unsolved += 1
-            else:
-                total_time_to_solve += int(time_to_solve)
-                num_solved += 1
-
-        return total_time_to_solve, num_unsolved, num_solved
+        # Apply the solver to each problem as is to retrieve the time to solve/whether it is solvable
+        m = self.copy_with_solver_options(None)
+        return self.aggregate_records([m.run_solver(problem_dir, fname) for fname in problems])
@@ -0,0 +1,254 @@
+import bisect
+import json
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+
+"""
+=====================================================
+|Live metrics of long-running searches|
+=====================================================
+"""
+
+
+# Upper bounds (in seconds) of the buckets of the histograms
+DEFAULT_BUCKETS = [0.01, 0.05, 0.1, 0.5, 1, 5, 10, 30, 60, 120, 300, 600]
+
+# Prefix of the names of the metrics in the Prometheus text format
+PREFIX = "metagrammar_"
+
+
+class Metrics:
+    """
+    Metrics holds the counters, gauges and histograms of a search. Every solver run,
+    evaluation and result cache lookup of a Metagrammar (and of its copies, which share
+    its Metrics) is counted, and the search drivers record the best score so far. The
+    metrics can be read as a JSON snapshot or in the Prometheus text format, e.g. through
+    start_server.
+
+    Processes started by the search (e.g. the islands of island.py) count their own
+    metrics, which are not seen by the parent process.
+    """
+
+    def __init__(self, buckets: list = DEFAULT_BUCKETS):
+        self.buckets = list(buckets)
+        self.start_time = time.time()
+        self.counters = {}
+        self.gauges = {}
+        self.histograms = {}
+
+        # (seconds since start, score) every time the best score improved
+        self.best_history = []
+        self.lock = threading.Lock()
+
+
+    def __getstate__(self):
+        """
+        Pickles the metrics without their lock so they can be sent to other processes
+        """
+        state = self.__dict__.copy()
+        del state["lock"]
+        return state
+
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.lock = threading.Lock()
+
+
+    def inc(
+        self,
+        name: str,
+        value: float = 1,
+    ):
+        """
+        Adds value to the counter name
+        """
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+
+    def set(
+        self,
+        name: str,
+        value: float,
+    ):
+        """
+        Sets the gauge name to value
+        """
+        with self.lock:
+            self.gauges[name] = value
+
+
+    def add(
+        self,
+        name: str,
+        value: float,
+    ):
+        """
+        Adds value (possibly negative) to the gauge name
+        """
+        with self.lock:
+            self.gauges[name] = self.gauges.get(name, 0) + value
+
+
+    def observe(
+        self,
+        name: str,
+        value: float,
+    ):
+        """
+        Adds an observation to the histogram name
+        """
+        with self.lock:
+            if name not in self.histograms:
+                self.histograms[name] = {"counts": [0] * (len(self.buckets) + 1), "sum": 0.0, "count": 0}
+            h = self.histograms[name]
+            h["counts"][bisect.bisect_left(self.buckets, value)] += 1
+            h["sum"] += value
+            h["count"] += 1
+
+
+    def record_best(self, score: float):
+        """
+        Records score as the best score so far if it is better than the previous one
+        """
+        with self.lock:
+            if self.best_history and self.best_history[-1][1] <= score:
+                return
+            self.best_history.append((time.time() - self.start_time, score))
+            self.gauges["best_score"] = score
+
+
+    def get_total(self, name: str) -> float:
+        """
+        Gets the value of the counter name, or the sum of the observations of the
+        histogram name (0 if there is neither)
+        """
+        with self.lock:
+            if name in self.histograms:
+                return self.histograms[name]["sum"]
+            return self.counters.get(name, 0)
+
+
+    def get_rates(self) -> dict:
+        """
+        Gets the metrics derived from the counters and gauges: evaluations and solver
+        runs per second since the start, hit rate of the result cache and the fraction of
+        evaluation workers that are busy
+        """
+        uptime = time.time() - self.start_time
+        hits = self.counters.get("cache_hits_total", 0)
+        lookups = hits + self.counters.get("cache_misses_total", 0)
+        workers = self.gauges.get("workers", 0)
+        return {
+            "uptime_seconds": uptime,
+            "evaluations_per_second": self.counters.get("evaluations_total", 0) / uptime if uptime else 0.0,
+            "solver_runs_per_second": self.counters.get("solver_runs_total", 0) / uptime if uptime else 0.0,
+            "cache_hit_rate": hits / lookups if lookups else 0.0,
+            "worker_utilization": self.gauges.get("busy_workers", 0) / workers if workers else 0.0,
+        }
+
+
+    def snapshot(self) -> dict:
+        """
+        Returns a copy of every metric as a dictionary that can be written as JSON
+        """
+        with self.lock:
+            return {
+                "time": time.time(),
+                "counters": dict(self.counters),
+                "gauges": dict(self.gauges),
+                "histograms": {name: {"buckets": self.buckets, "counts": list(h["counts"]), "sum": h["sum"],
+                                      "count": h["count"]} for name, h in self.histograms.items()},
+                "rates": self.get_rates(),
+                "best_history": list(self.best_history),
+            }
+
+
+    def to_prometheus(self) -> str:
+        """
+        Returns every metric in the Prometheus text exposition format
+        """
+        s = self.snapshot()
+        lines = []
+        for name, value in sorted(s["counters"].items()):
+            lines += ["# TYPE " + PREFIX + name + " counter", PREFIX + name + " " + repr(float(value))]
+        for name, value in sorted(list(s["gauges"].items()) + list(s["rates"].items())):
+            lines += ["# TYPE " + PREFIX + name + " gauge", PREFIX + name + " " + repr(float(value))]
+        for name, h in sorted(s["histograms"].items()):
+            lines.append("# TYPE " + PREFIX + name + " histogram")
+            total = 0
+            for bound, count in zip(self.buckets + ["+Inf"], h["counts"]):
+                total += count
+                lines.append(PREFIX + name + '_bucket{le="' + str(bound) + '"} ' + str(total))
+            lines.append(PREFIX + name + "_sum " + repr(float(h["sum"])))
+            lines.append(PREFIX + name + "_count " + str(h["count"]))
+        return "\n".join(lines) + "\n"
+
+
+    def write_snapshot(self, filename: str):
+        """
+        Writes a JSON snapshot to filename, replacing the previous one at once so readers
+        never see a partial file
+        """
+        Path(os.path.dirname(filename) or ".").mkdir(parents=True, exist_ok=True)
+        with open(filename + ".tmp", 'w') as f:
+            json.dump(self.snapshot(), f, indent=1)
+        os.replace(filename + ".tmp", filename)
+
+
+def start_server(
+    metrics: Metrics,
+    port: int = 8000,
+    host: str = "127.0.0.1",
+) -> ThreadingHTTPServer:
+    """
+    Serves metrics in a background thread, in the Prometheus text format at /metrics and
+    as a JSON snapshot at /snapshot. Returns the server (call shutdown to stop it).
+    """
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path == "/metrics":
+                body = metrics.to_prometheus().encode()
+                content_type = "text/plain; version=0.0.4"
+            elif self.path == "/snapshot":
+                body = json.dumps(metrics.snapshot()).encode()
+                content_type = "application/json"
+            else:
+                self.send_error(404)
+                return
+            self.send_response(200)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            # Do not print a line per scrape
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def start_snapshots(
+    metrics: Metrics,
+    filename: str = "results/metrics.json",
+    interval: float = 60,
+) -> threading.Event:
+    """
+    Writes a JSON snapshot of metrics to filename every interval seconds in a background
+    thread. Returns an event that stops the snapshots (after a last one) when set.
+    """
+    stop = threading.Event()
+    def run():
+        while not stop.wait(interval):
+            metrics.write_snapshot(filename)
+        metrics.write_snapshot(filename)
+    threading.Thread(target=run, daemon=True).start()
+    return stop
@@ -0,0 +1,328 @@
+import csv
+import os
+import random
+from abc import ABC, abstractmethod
+from pathlib import Path
+from metagrammar import Metagrammar
+from solveroptions import mutate_options, cross_options
+from candidates import rand_candidate
+
+
+class Optimizer(ABC):
+    """
+    An Optimizer searches over the candidates of a Metagrammar through an
+    ask/tell interface: ask(n) proposes up to n candidates, which are scored together, and
+    tell reports their (score, num_unsolved, num_solved) back. Candidates are compared by
+    score, then by number of unsolved problems.
+
+    run drives this loop until a budget of solver seconds is spent, i.e. the wall-clock
+    time of every solver run summed over all of the runs (runs answered by the result
+    cache are free). After each batch it records the best result so far against the
+    solver seconds spent so far, so different optimizers can be compared by how well they
+    use the same amount of compute (see compare.py).
+
+    Subclasses implement ask and extend tell, see search.py for all of them.
+    """
+
+    def __init__(
+        self,
+        metagrammar: Metagrammar,
+        problem_dir: str,
+        problems: list,
+        batch_size: int = 4,
+        num_workers: int = None,
+        rng: random.Random = None,
+        option_rate: float = 0.1,
+        weights: list = None,
+    ):
+        """
+        Creates an Optimizer over the candidates of metagrammar scored on problems.
+        batch_size is the number of candidates asked for at once and num_workers the number
+        of them scored at once (by default batch_size). rng is the source of randomness (by
+        default the random module) and option_rate the probability that each solver option
+        of a new candidate is mutated. weights are the weights of the problems in the score
+        (see Metagrammar.score).
+        """
+        self.metagrammar = metagrammar
+        self.problem_dir = problem_dir
+        self.problems = problems
+        self.batch_size = batch_size
+        self.num_workers = num_workers
+        self.rng = rng or random
+        self.option_rate = option_rate
+        self.weights = weights
+
+        # Best candidate so far as [candidate, score, num_unsolved, num_solved]
+        self.best = None
+
+        # Results of scored candidates by canonical hash, used to skip isomorphic candidates
+        self.seen = {}
+
+        # Budget of run and solver seconds spent in it so far, and batches of the current
+        # run out of its max_batches, see get_progress
+        self.budget = None
+        self.spent = 0.0
+        self.max_batches = None
+        self.num_batches = 0
+
+        # (solver seconds, number of candidates scored, best score, best number unsolved) after each batch
+        self.curve = []
+
+
+    def copy_candidate(self, candidate: list) -> list:
+        """
+        Returns a copy of candidate that shares no rows (or options) with it
+        """
+        return [dict(x) if type(x) == dict else [list(row) for row in x] for x in candidate]
+
+
+    def random_candidate(self) -> list:
+        """
+        Returns a candidate with every entry of its active rules drawn at random, and random
+        solver options if the metagrammar has any
+        """
+        return rand_candidate(self.metagrammar, self.rng)
+
+
+    def neighbor(
+        self,
+        candidate: list,
+        num_flips: int,
+    ) -> list:
+        """
+        Returns a new candidate with num_flips random entries of candidate flipped and its
+        solver options mutated
+        """
+        ret = self.copy_candidate(candidate)
+        active_rules, options = self.metagrammar.split_candidate(ret)
+        if options is not None:
+            ret[-1] = mutate_options(options, self.rng, self.option_rate)
+        for _ in range(num_flips):
+            k = self.rng.randint(0, len(active_rules)-1)
+            i = self.rng.randint(0, len(ret[k])-1)
+            j = self.rng.randint(0, len(ret[k][i])-1)
+            ret[k][i][j] = not ret[k][i][j]
+        return ret
+
+
+    @staticmethod
+    def get_key(result: tuple) -> tuple:
+        """
+        Gets the key candidates are compared by from their (score, num_unsolved,
+        num_solved), lower is better
+        """
+        return result[0], result[1]
+
+
+    def get_solver_seconds(self) -> float:
+        """
+        Gets the solver seconds spent by the metagrammar (and its copies) so far
+        """
+        return self.metagrammar.metrics.get_total("solver_wall_seconds")
+
+
+    def get_progress(self) -> float:
+        """
+        Gets the fraction of run done so far: of its budget of solver seconds, or of its
+        max_batches, whichever is closer to the end (0 outside of run or without either)
+        """
+        progress = [0.0]
+        if self.budget:
+            progress.append(self.spent / self.budget)
+        if self.max_batches:
+            progress.append(self.num_batches / self.max_batches)
+        return min(1.0, max(progress))
+
+
+    def evaluate(self, candidates: list) -> list:
+        """
+        Scores candidates concurrently, skipping the ones isomorphic to a candidate that was
+        already scored. Returns the (score, num_unsolved, num_solved) of each candidate.
+        """
+        hashes = [self.metagrammar.canonical_hash(c) for c in candidates]
+        to_score = {}
+        for h, c in zip(hashes, candidates):
+            if h not in self.seen and h not in to_score:
+                to_score[h] = c
+
+        results = self.metagrammar.score_candidates(self.problem_dir, self.problems, list(to_score.values()),
+                                                    self.num_workers or self.batch_size, self.weights)
+        for h, result in zip(to_score.keys(), results):
+            self.seen[h] = result
+
+        return [self.seen[h] for h in hashes]
+
+
+    @abstractmethod
+    def ask(self, n: int) -> list:
+        """
+        Proposes up to n candidates to score
+        """
+
+
+    def tell(
+        self,
+        candidates: list,
+        results: list,
+    ):
+        """
+        Reports the (score, num_unsolved, num_solved) of candidates, in order, and updates
+        the best candidate so far
+        """
+        for candidate, result in zip(candidates, results):
+            if self.best is None or self.get_key(result) < self.get_key(self.best[1:]):
+                self.best = [candidate] + list(result)
+                self.metagrammar.metrics.record_best(self.best[1])
+                print("[DEBUG]: Updated!")
+
+
+    def run(
+        self,
+        budget: float = None,
+        max_batches: int = None,
+        max_idle_batches: int = 100,
+    ) -> list:
+        """
+        Asks for, scores and tells batches of batch_size candidates until budget solver
+        seconds are spent, max_batches batches were scored (None for no limit on either)
+        or no new candidate was scored in max_idle_batches batches in a row. The last batch
+        may overshoot the budget. run can be called again to go on with the search. Returns
+        the best candidate with its score, number of unsolved problems and number of solved
+        problems.
+        """
+        self.budget = budget
+        self.max_batches = max_batches
+        self.num_batches = 0
+        start = self.get_solver_seconds() - self.spent
+        num_idle_batches = 0
+        while (budget is None or self.spent < budget) and (max_batches is None or self.num_batches < max_batches):
+            candidates = self.ask(self.batch_size)
+            if not candidates:
+                break
+            num_seen = len(self.seen)
+            results = self.evaluate(candidates)
+            self.tell(candidates, results)
+            self.metagrammar.metrics.inc("search_steps_total")
+
+            self.num_batches += 1
+            num_idle_batches = num_idle_batches + 1 if len(self.seen) == num_seen else 0
+            self.spent = self.get_solver_seconds() - start
+            self.curve.append((self.spent, len(self.seen), self.best[1], self.best[2]))
+            print("[DEBUG] Solver Seconds: ", round(self.spent, 3), "/", budget, " | Scored: ", len(self.seen),
+                  " | Best Score: ", self.best[1], " | Best Unsolved: ", self.best[2],
+                  " | Best Solved: ", self.best[3])
+            if num_idle_batches >= max_idle_batches:
+                print("[DEBUG] No new candidates, stopping")
+                break
+        return self.best
+
+
+    def write_curve(self, filename: str):
+        """
+        Writes the best score versus solver seconds curve recorded by run to filename as CSV
+        """
+        Path(os.path.dirname(filename) or ".").mkdir(parents=True, exist_ok=True)
+        with open(filename, 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(["solver_seconds", "num_scored", "best_score", "best_unsolved"])
+            writer.writerows(self.curve)
+
+
+class GeneticOptimizer(Optimizer):
+    """
+    A GeneticOptimizer runs the genetic algorithm of genetic.py (and of each island of
+    island.py): a generation starts with population_size random individuals, and every
+    next generation is a child of each ordered pair of the population_size best
+    individuals so far. Generations are scored batch_size individuals at a time, so with a
+    batch_size of population_size ** 2 each batch after the first one is a generation. A
+    child takes each entry from either parent, or a random value with probability 0.2.
+    """
+
+    def __init__(
+        self,
+        metagrammar: Metagrammar,
+        problem_dir: str,
+        problems: list,
+        population_size: int = 5,
+        **kwargs,
+    ):
+        """
+        Creates a GeneticOptimizer over metagrammar. See Optimizer for the other
+        arguments.
+        """
+        super().__init__(metagrammar, problem_dir, problems, **kwargs)
+        self.population_size = population_size
+
+        # Scored individuals as [individual, score, num_unsolved, num_solved] and the
+        # canonical hashes of the ones in the pool
+        self.pool = []
+        self.pool_hashes = set()
+
+        # Individuals of the current generation that were not asked for yet
+        self.queue = []
+
+
+    def crossover(
+        self,
+        individual1: list,
+        individual2: list,
+    ) -> list:
+        """
+        Returns a child of individual1 and individual2
+        """
+        ret = []
+        for a, b in zip(individual1, individual2):
+            if type(a) == dict:
+                ret.append(cross_options(a, b, self.rng, self.option_rate))
+            else:
+                ret.append([[self.rng.choices([x, y, True, False], weights=[4, 4, 1, 1])[0]
+                             for x, y in zip(row1, row2)] for row1, row2 in zip(a, b)])
+        return ret
+
+
+    def ask(self, n: int) -> list:
+        if not self.queue:
+            # Start the next generation from the best individuals so far
+            self.pool.sort(key=lambda x: self.get_key(x[1:]))
+            self.pool = self.pool[:self.population_size]
+            self.pool_hashes = set(self.metagrammar.canonical_hash(x[0]) for x in self.pool)
+            if len(self.pool) < self.population_size:
+                self.queue = [self.random_candidate() for _ in range(self.population_size - len(self.pool))]
+            else:
+                self.queue = [self.crossover(x[0], y[0]) for x in self.pool for y in self.pool]
+        ret, self.queue = self.queue[:n], self.queue[n:]
+        return ret
+
+
+    def tell(
+        self,
+        candidates: list,
+        results: list,
+    ):
+        super().tell(candidates, results)
+        for candidate, result in zip(candidates, results):
+            h = self.metagrammar.canonical_hash(candidate)
+            if h not in self.pool_hashes:
+                # Isomorphic individuals are kept once
+                self.pool_hashes.add(h)
+                self.pool.append([candidate] + list(result))
+
+
+    def add(self, individuals: list):
+        """
+        Adds individuals that were already scored on the same problems, as [individual,
+        score, num_unsolved, num_solved] (e.g. migrants from another island), to the pool
+        """
+        for individual in individuals:
+            h = self.metagrammar.canonical_hash(individual[0])
+            self.seen.setdefault(h, tuple(individual[1:]))
+            if h not in self.pool_hashes:
+                self.pool_hashes.add(h)
+                self.pool.append(list(individual))
+
+
+    def get_pool(self) -> list:
+        """
+        Returns the population_size best individuals so far, best first
+        """
+        return sorted(self.pool, key=lambda x: self.get_key(x[1:]))[:self.population_size]
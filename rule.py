@@ -1,4 +1,7 @@
 import numpy as np
+import copy
+import hashlib
+import itertools
 from sygusproblem import SyGuSProblem
 from sexp_utils import *
 
@@ -26,7 +29,8 @@ class Rule:
         self, 
         name: str, 
         nonterminal_type, 
-        base_subrule
+        base_subrule,
+        num_nonterminals: int = 3,
     ):
         """
         Creates an empty Rule with no subrules included
@@ -38,8 +42,8 @@ class Rule:
         # Whether rule is active or not
         self.active_rules = []
 
-        # 3 nonterminals within this Rule, TODO: Try changing number of nonterminals per type
-        self.num_nonterminals = 3
+        # 3 nonterminals within this Rule by default
+        self.num_nonterminals = num_nonterminals
 
         for _ in range(self.num_nonterminals):
             self.active_rules.append([])
@@ -60,16 +64,35 @@ class Rule:
         # TODO: See if there is anything we can do about removing the nonterminal entirely
         self.base_subrule = base_subrule
 
+        # (label, operands) describing each subrule, used to find nonterminal symmetries
+        self.subrule_keys = []
+
+        # Cached column permutations induced by renaming the non-start nonterminals
+        self.symmetries = None
+
+        # Rule specification this Rule was compiled from, if any (see rulespec.py)
+        self.spec = None
+
 
     def add_subrule(
         self, 
         subrule, 
-        is_active: bool = True
+        is_active: bool = True,
+        label: str = None,
+        operands: list = None,
     ):
         """
-        Adds a subrule to the Rule and active setting is set to is_active
+        Adds a subrule to the Rule and active setting is set to is_active. The optional
+        label (e.g. "bvadd") and operands (the nonterminals the subrule refers to, either
+        as indices or as Symbols such as BitVec1) describe the subrule for symmetry
+        detection. Subrules without a label are assumed to not refer to any nonterminal.
         """
         self.subrules.append(subrule)
+        if label is None:
+            self.subrule_keys.append(None)
+        else:
+            self.subrule_keys.append((label, tuple(self.get_nonterminal_index(o) for o in operands or [])))
+        self.symmetries = None
 
         # By default, added rule is activiated
         for i in range(self.num_nonterminals):
@@ -109,6 +132,63 @@ class Rule:
                     self.active_rules[i][j] = 0
 
 
+    def canonicalize(
+        self,
+        active_rules: list = None,
+    ) -> list:
+        """
+        Returns the canonical form of an active_rules matrix (defaults to the current one)
+        under renaming of the non-start nonterminals. Two matrices that generate the same
+        grammar up to renaming of Type1, Type2, etc. have the same canonical form.
+        """
+        if active_rules is None:
+            active_rules = self.active_rules
+
+        best = None
+        for row_perm, col_perm in self.get_symmetries():
+            permuted = [[False] * self.num_subrules for _ in range(self.num_nonterminals)]
+            for i in range(self.num_nonterminals):
+                for j in range(self.num_subrules):
+                    permuted[row_perm[i]][col_perm[j]] = bool(active_rules[i][j])
+            if best is None or permuted < best:
+                best = permuted
+        return best
+
+
+    def to_canonical_string(
+        self,
+        active_rules: list = None,
+    ) -> str:
+        """
+        Converts the canonical form of active_rules (see canonicalize) to string format
+        """
+        return "".join("1" if v else "0" for row in self.canonicalize(active_rules) for v in row)
+
+
+    def canonical_hash(
+        self,
+        active_rules: list = None,
+    ) -> str:
+        """
+        Returns a hash of the canonical form of active_rules, equal for isomorphic candidates
+        """
+        return hashlib.sha1(self.to_canonical_string(active_rules).encode()).hexdigest()
+
+
+    def copy_with_active_rules(
+        self,
+        active_rules: list,
+    ):
+        """
+        Returns a copy of the Rule that shares its subrules but uses its own copy of the
+        active_rules matrix, so that several candidates can be evaluated at the same time
+        """
+        ret = copy.copy(self)
+        ret.active_rules = [list(row) for row in self.active_rules]
+        ret.set_active_rules([list(row) for row in active_rules])
+        return ret
+
+
     def set_active_rules(self, 
         new_rules: list
     ):
@@ -133,11 +213,16 @@ class Rule:
 
     def generate_grammar(
         self, 
-        p: SyGuSProblem
+        p: SyGuSProblem,
+        active_rules: list = None,
     ):
         """
-        Generates grammar based on passed in problem as well as Rules matrix
+        Generates grammar based on passed in problem as well as Rules matrix (or active_rules
+        if given, e.g. the matrix of the Rule this one was instantiated from)
         """
+        if active_rules is None:
+            active_rules = self.active_rules
+
         ret = []
         for i in range(self.num_nonterminals):
             # Each tmp is a nonterminal in the grammar
@@ -145,7 +230,7 @@ class Rule:
             # Include base rule
             tmp[2].append(self.base_subrule(p))
             
-            for rule, is_active in zip(self.subrules, self.active_rules[i]):
+            for rule, is_active in zip(self.subrules, active_rules[i]):
                 if is_active:
                     for r in rule(p):
                         # Index 2 corresponds to the production rules
@@ -175,6 +260,53 @@ class Rule:
         return self.active_rules
 
 
+    def get_nonterminal_index(self, nonterminal) -> int:
+        """
+        Gets the index of a nonterminal given either its index or its Symbol e.g. BitVec1
+        """
+        if isinstance(nonterminal, int):
+            return nonterminal
+        name = dumps(nonterminal)
+        assert name.startswith(self.name) and name[len(self.name):].isdigit(), "Unknown nonterminal"
+        return int(name[len(self.name):])
+
+
+    def get_symmetries(self) -> list:
+        """
+        Gets the (row permutation, column permutation) pairs under which the Rule maps onto
+        itself, i.e. renamings of the non-start nonterminals that also map every subrule
+        onto another subrule. The identity is always included.
+        """
+        if self.symmetries is not None:
+            return self.symmetries
+
+        # Index of the k-th occurrence of every key so that duplicated subrules map in order
+        occurrences = []
+        key_to_indices = {}
+        for j, key in enumerate(self.subrule_keys):
+            key_to_indices.setdefault(key, []).append(j)
+            occurrences.append(len(key_to_indices[key]) - 1)
+
+        self.symmetries = []
+        # The start nonterminal (index 0) must stay first, the rest are interchangeable
+        for perm in itertools.permutations(range(1, self.num_nonterminals)):
+            row_perm = [0] + list(perm)
+            col_perm = []
+            for j, key in enumerate(self.subrule_keys):
+                if key is None:
+                    col_perm.append(j)
+                    continue
+                label, operands = key
+                new_key = (label, tuple(row_perm[o] for o in operands))
+                indices = key_to_indices.get(new_key, [])
+                if occurrences[j] >= len(indices):
+                    break
+                col_perm.append(indices[occurrences[j]])
+            else:
+                self.symmetries.append((row_perm, col_perm))
+        return self.symmetries
+
+
     def get_length(self) -> int:
         """
         Gets the number of possible rules to be included. Alternatively, gets the 
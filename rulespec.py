@@ -0,0 +1,233 @@
+import itertools
+import json
+import re
+from sexp_utils import *
+from rule import Rule
+
+
+"""
+A rule specification describes a Rule as plain data (e.g. loaded from JSON) instead of
+closures, for example:
+
+{
+    "name": "BitVec",
+    "sort": "(_ BitVec $width)",
+    "width": 4,
+    "base": "$zero",
+    "logics": ["BV"],
+    "num_nonterminals": 3,
+    "subrules": [
+        {"kind": "nonterminals"},
+        {"kind": "operator", "ops": ["bvneg", "bvnot"], "arity": 1},
+        {"kind": "operator", "ops": ["bvadd"], "operands": [[0, 1], [1, 0]]},
+        {"kind": "constants"},
+        {"kind": "variables"}
+    ]
+}
+
+The sort may contain $width, in which case the rule applies to bit-vectors of any width
+and is instantiated for the widths of the problem it is used on ("width" is the width
+used when the rule is compiled on its own). In "base", $width is replaced as well and
+$zero stands for the zero literal of the sort. "logics" lists the logics (as given by
+set-logic) the rule is used for, all logics if omitted.
+
+Each entry of "subrules" adds one or more subrules (columns of the Rule):
+    nonterminals: one subrule per nonterminal that produces that nonterminal
+    operator:     for every combination of operand nonterminals (all combinations of
+                  length "arity" unless "operands" lists them) and for every op in "ops",
+                  a subrule producing (op operand1 operand2 ...)
+    constants:    the constants of the problem of the sort (see SyGuSProblem.get_constants)
+    variables:    the variables of the problem of the sort (see SyGuSProblem.get_variables)
+
+Compiling a specification precomputes the productions of every subrule, and the resulting
+subrules are plain objects so the Rule (and a Metagrammar made of such rules) can be
+pickled and sent to other processes.
+"""
+
+
+class Productions:
+    """
+    A subrule that always produces the same precomputed productions
+    """
+
+    def __init__(self, productions: list):
+        self.productions = productions
+
+
+    def __call__(self, problem) -> list:
+        return self.productions
+
+
+class BaseTerm:
+    """
+    A base subrule that always produces the same precomputed term
+    """
+
+    def __init__(self, term):
+        self.term = term
+
+
+    def __call__(self, problem):
+        return self.term
+
+
+class ProblemConstants:
+    """
+    A subrule that produces the constants used in the definitions of the problem. If width
+    is given, bit-vector literals of other widths are left out.
+    """
+
+    def __init__(self, width: int = None):
+        self.width = width
+
+
+    def __call__(self, problem) -> list:
+        return [create_symbol(c) for c in problem.get_constants()
+                if self.width is None or get_literal_width(c) in (None, self.width)]
+
+
+class ProblemVariables:
+    """
+    A subrule that produces the variables declared by the problem, only the ones of sort if
+    it is given
+    """
+
+    def __init__(self, sort = None):
+        self.sort = sort
+
+
+    def __call__(self, problem) -> list:
+        return [create_symbol(v) for v in problem.get_variables(self.sort)]
+
+
+def get_literal_width(literal: str) -> int:
+    """
+    Gets the width of a bit-vector literal e.g. #x0f or #b101 (None if not a bit-vector)
+    """
+    literal = literal.lstrip("\\")
+    if literal.startswith("#x"):
+        return 4 * (len(literal) - 2)
+    if literal.startswith("#b"):
+        return len(literal) - 2
+    return None
+
+
+def get_zero_literal(width: int) -> str:
+    """
+    Gets the zero literal of a bit-vector of width bits
+    """
+    if width % 4 == 0:
+        return "#x" + "0" * (width // 4)
+    return "#b" + "0" * width
+
+
+def match_sort(
+    pattern: str,
+    sort,
+) -> dict:
+    """
+    Matches the sort of a rule specification (possibly containing $width) against sort.
+    Returns the values of the parameters in pattern, or None if sort does not match.
+    """
+    # Normalize the spacing of pattern to that of exported sorts
+    pattern = export_sexp_raw(create_symbol(pattern))
+    regex = re.escape(pattern).replace(re.escape("$width"), "(?P<width>[0-9]+)")
+    match = re.fullmatch(regex, export_sexp_raw(sort))
+    if not match:
+        return None
+    return {k: int(v) for k, v in match.groupdict().items()}
+
+
+def compile_rule(
+    spec: dict,
+    sort = None,
+    name: str = None,
+) -> Rule:
+    """
+    Compiles a rule specification (see above) into a Rule with all of its subrules active.
+    The rule is compiled for sort if given (which has to match the sort of the spec) and
+    its nonterminals are named after name (by default the name of the spec).
+    """
+    params = {"width": spec.get("width", 4)} if "$width" in spec["sort"] else {}
+    if sort is not None:
+        params = match_sort(spec["sort"], sort)
+        assert params is not None, "Sort does not match the rule"
+
+    def substitute(term: str) -> str:
+        if "width" in params:
+            term = term.replace("$zero", get_zero_literal(params["width"]))
+            term = term.replace("$width", str(params["width"]))
+        return term
+
+    if name is None:
+        name = spec["name"]
+    rule_sort = create_symbol(substitute(spec["sort"]))
+    num_nonterminals = spec.get("num_nonterminals", 3)
+    nonterminals = [create_symbol(name + str(i)) for i in range(num_nonterminals)]
+
+    r = Rule(name, rule_sort, BaseTerm(create_symbol(substitute(spec["base"]))), num_nonterminals)
+    r.spec = spec
+
+    for s in spec["subrules"]:
+        kind = s["kind"]
+        if kind == "nonterminals":
+            for i, nt in enumerate(nonterminals):
+                r.add_subrule(Productions([nt]), label="nonterminal", operands=[i])
+
+        elif kind == "operator":
+            if "operands" in s:
+                combinations = [tuple(c) for c in s["operands"]]
+            else:
+                combinations = itertools.product(range(num_nonterminals), repeat=s["arity"])
+            for operands in combinations:
+                for op in s["ops"]:
+                    production = [create_symbol(op)] + [nonterminals[o] for o in operands]
+                    r.add_subrule(Productions([production]), label=op, operands=list(operands))
+
+        elif kind == "constants":
+            r.add_subrule(ProblemConstants(params.get("width")))
+
+        elif kind == "variables":
+            r.add_subrule(ProblemVariables(rule_sort))
+
+        else:
+            raise ValueError("Unknown subrule kind: ", kind)
+
+    return r
+
+
+def instantiate_rule(
+    r: Rule,
+    sort,
+) -> Rule:
+    """
+    Instantiates r for sort, returning None if r does not apply to sort. A rule compiled
+    from a spec is recompiled for sort, any other rule only applies to its own sort.
+    """
+    if r.spec is None:
+        if export_sexp_raw(r.get_nonterminal_type()) != export_sexp_raw(sort):
+            return None
+        return r
+
+    params = match_sort(r.spec["sort"], sort)
+    if params is None:
+        return None
+    return compile_rule(r.spec, sort)
+
+
+def rule_supports_logic(
+    r: Rule,
+    logic: str,
+) -> bool:
+    """
+    Returns whether r is used for problems in logic (see "logics" above)
+    """
+    return r.spec is None or "logics" not in r.spec or logic in r.spec["logics"]
+
+
+def load_rule(filename: str) -> Rule:
+    """
+    Reads a rule specification from a JSON file and compiles it into a Rule
+    """
+    with open(filename, 'r') as f:
+        return compile_rule(json.load(f))
@@ -0,0 +1,39 @@
+from metagrammar import Metagrammar
+from optimizer import Optimizer, GeneticOptimizer
+from hillclimb import HillClimber
+from tabu import TabuSearch
+from annealing import AnnealingOptimizer
+from bayesopt import BayesianOptimizer
+
+
+"""
+The optimizers (see optimizer.py) that can be selected by name in the drivers (main.py,
+compare.py). They live here rather than in optimizer.py since every one of them imports
+optimizer.py.
+"""
+
+
+# Optimizers that can be selected per run
+OPTIMIZERS = {
+    "hillclimb": HillClimber,
+    "tabu": TabuSearch,
+    "genetic": GeneticOptimizer,
+    "annealing": AnnealingOptimizer,
+    "bayes": BayesianOptimizer,
+}
+
+
+def create_optimizer(
+    name: str,
+    metagrammar: Metagrammar,
+    problem_dir: str,
+    problems: list,
+    **kwargs,
+) -> Optimizer:
+    """
+    Creates the Optimizer called name, one of OPTIMIZERS, over metagrammar (see Optimizer
+    for the other arguments)
+    """
+    if name not in OPTIMIZERS:
+        raise ValueError("Unknown optimizer: " + name + ", expected one of " + ", ".join(OPTIMIZERS))
+    return OPTIMIZERS[name](metagrammar, problem_dir, problems, **kwargs)
@@ -1,3 +1,4 @@
+import re
 from sexpdata import loads, dumps, Symbol # Everything we need to read SyGuS files (.sl)
 
 
@@ -29,6 +30,85 @@ def get_sexp(filename: str):
         raise ValueError("Error with reading filename: ", filename)
 
 
+# Characters that change the nesting of a sexp or start a comment/string/quoted symbol
+SEXP_SPECIAL_CHARS = re.compile(rb'[();"|]')
+
+# Opening parenthesis of a list followed by its first symbol
+SEXP_HEAD = re.compile(rb'\(\s*([^\s()]*)')
+
+# Whitespace and comments between two elements of a sexp
+SEXP_WHITESPACE = re.compile(rb'(\s|;[^\n]*)*')
+
+# A single atom e.g. Int or #x0
+SEXP_ATOM = re.compile(rb'[^\s();]+')
+
+
+def get_sexp_offsets(
+    data: bytes,
+    start: int = 0,
+    end: int = None,
+) -> list:
+    """
+    Scans data[start:end] without parsing it and returns the (start, end) byte offsets
+    of every top-level list, skipping over comments, strings and quoted symbols.
+    """
+    if end is None:
+        end = len(data)
+
+    offsets = []
+    depth = 0
+    list_start = start
+    pos = start
+    while True:
+        match = SEXP_SPECIAL_CHARS.search(data, pos, end)
+        if not match:
+            break
+        i = match.start()
+        c = data[i:i+1]
+        if c == b'(':
+            if depth == 0:
+                list_start = i
+            depth += 1
+            pos = i + 1
+        elif c == b')':
+            depth -= 1
+            pos = i + 1
+            if depth == 0:
+                offsets.append((list_start, pos))
+        elif c == b';':
+            # Comments run until the end of the line
+            newline = data.find(b'\n', i, end)
+            pos = end if newline < 0 else newline + 1
+        elif c == b'"':
+            # Strings escape quotes by doubling them
+            pos = i + 1
+            while True:
+                quote = data.find(b'"', pos, end)
+                if quote < 0:
+                    pos = end
+                    break
+                if data[quote+1:quote+2] == b'"':
+                    pos = quote + 2
+                else:
+                    pos = quote + 1
+                    break
+        else:
+            bar = data.find(b'|', i + 1, end)
+            pos = end if bar < 0 else bar + 1
+    return offsets
+
+
+def get_sexp_head(
+    data: bytes,
+    start: int,
+) -> str:
+    """
+    Returns the first symbol of the list starting at offset start, e.g. "synth-fun".
+    """
+    match = SEXP_HEAD.match(data, start)
+    return match.group(1).decode() if match else ""
+
+
 def export_sexp_raw(sexp):
     """
     Returns sexp with replaced special character #.
@@ -43,6 +123,14 @@ def export_sexp(sexp):
     return export_sexp_raw(sexp)[1:-1]
 
 
+def export_grammar(grammar: list):
+    """
+    Returns a grammar (list of sexps as generated by a Metagrammar) ready to insert in
+    the synth-fun of a SyGuS problem.
+    """
+    return " ".join(export_sexp_raw(g) for g in grammar)
+
+
 def create_symbol(term: str):
     """
     Returns a Symbol containing term.
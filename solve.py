@@ -0,0 +1,212 @@
+import argparse
+import os
+import queue
+import threading
+import time
+from contextlib import ExitStack
+from pathlib import Path
+from sexp_utils import *
+from metagrammar import Metagrammar
+from sygusproblem import LazySyGuSProblem
+from rulespec import load_rule
+
+
+"""
+=====================================================
+|Portfolio solving with learned metagrammars|
+=====================================================
+"""
+
+
+class Portfolio:
+    """
+    A Portfolio solves new problems by racing several learned candidates of a metagrammar
+    (and, unless include_original is unset, the original grammar of the problem). The
+    problem is generated with the grammar of each candidate, one solver is started per
+    grammar, and the first solver that finds a solution wins while the others are killed.
+
+    A candidate is a list of active_rules matrices, one per rule of the metagrammar.
+    """
+
+    def __init__(
+        self,
+        metagrammar: Metagrammar,
+        candidates: list,
+        include_original: bool = True,
+        timeout: int = 60000,
+    ):
+        """
+        Creates a Portfolio racing candidates of metagrammar. Every solver is given a
+        timeout in ms (see Metagrammar.get_solver_command) on top of the wall_limit of the
+        metagrammar.
+        """
+        self.metagrammar = metagrammar
+        self.candidates = candidates
+        self.include_original = include_original
+        self.timeout = timeout
+
+
+    def get_entries(
+        self,
+        problem_dir: str,
+        problem_name: str,
+    ) -> list:
+        """
+        Returns the (label, data, metagrammar) of every grammar raced on a problem, where
+        data is the generated problem or None for the original file and metagrammar is the
+        copy that runs the solver (with the solver options of the candidate). Candidates
+        that have no rule for the problem are left out.
+        """
+        entries = []
+        if self.include_original:
+            # The original grammar with the default options of CVC5
+            entries.append(("original", None, self.metagrammar.copy_with_solver_options(None)))
+
+        # Note: not read through Metagrammar.get_problem, new problems are only solved once
+        p = LazySyGuSProblem(problem_name)
+        p.read_sygus_problem(problem_dir, problem_name)
+        for i, c in enumerate(self.candidates):
+            m = self.metagrammar.copy_with_active_rules(c)
+            try:
+                grammar = export_grammar(m.generate_grammar_from_rules(p))
+            except ValueError:
+                continue
+            entries.append((i, p.export_with_grammar_string(grammar), m))
+        return entries
+
+
+    def solve(
+        self,
+        problem_dir: str,
+        problem_name: str,
+    ) -> dict:
+        """
+        Races the grammars of the portfolio on a problem and returns the problem, the
+        solution ("timeout or fail" if no solver found one), the label of the winner (the
+        index of the candidate, "original" or None), the wall-clock seconds of the race and
+        the record of every solver (see Metagrammar.run_solver) by label
+        """
+        m = self.metagrammar
+        start = time.perf_counter()
+        entries = self.get_entries(problem_dir, problem_name)
+
+        with ExitStack() as stack:
+            procs = []
+            for k, (label, data, mk) in enumerate(entries):
+                if data is None:
+                    path, pass_fds = problem_dir + problem_name, ()
+                else:
+                    path, pass_fds = stack.enter_context(m.delivery.deliver(data, "portfolio_" + str(k) + ".sl"))
+                sh_cmd = mk.get_solver_command("", path, timeout=self.timeout)
+                procs.append(m.start_solver(sh_cmd, pass_fds))
+
+            # Wait for every solver in its own thread and take the first solution
+            results = queue.Queue()
+            def wait(k):
+                results.put((k, m.wait_solver(procs[k])))
+            threads = [threading.Thread(target=wait, args=(k,)) for k in range(len(procs))]
+            for t in threads:
+                t.start()
+
+            records = {}
+            winner = None
+            for _ in range(len(threads)):
+                k, record = results.get()
+                records[entries[k][0]] = record
+                if record["result"] != "timeout or fail":
+                    winner = entries[k][0]
+                    break
+
+            # Kill the losers, their threads return as soon as they are reaped
+            for proc in procs:
+                m.kill_solver(proc)
+            for t in threads:
+                t.join()
+            while not results.empty():
+                k, record = results.get()
+                records[entries[k][0]] = record
+
+        return {
+            "problem": problem_name,
+            "result": "(" + records[winner]["result"] if winner is not None else "timeout or fail",
+            "winner": winner,
+            "seconds": time.perf_counter() - start,
+            "records": records,
+        }
+
+
+    def solve_dir(self, problem_dir: str):
+        """
+        Solves the .sl files of problem_dir one at a time, yielding the result of each (see
+        solve) as soon as it is solved
+        """
+        with os.scandir(problem_dir) as it:
+            for entry in it:
+                if entry.is_file() and entry.name.endswith(".sl"):
+                    yield self.solve(problem_dir, entry.name)
+
+
+def save_pool(
+    metagrammar: Metagrammar,
+    pool: list,
+    filename: str = "results/pool.txt",
+):
+    """
+    Writes a pool, a list of [candidate, score, num_unsolved, num_solved] sorted by score,
+    to filename with one candidate per line (see Metagrammar.to_string)
+    """
+    Path(os.path.dirname(filename) or ".").mkdir(parents=True, exist_ok=True)
+    with open(filename, 'w') as f:
+        for [candidate, score, num_unsolved, num_solved] in pool:
+            f.write(metagrammar.to_string(candidate) + " " + str(score) + " " + str(num_unsolved) + " "
+                    + str(num_solved) + "\n")
+
+
+def load_pool(
+    metagrammar: Metagrammar,
+    filename: str = "results/pool.txt",
+    k: int = None,
+) -> list:
+    """
+    Reads the first k candidates (by default all of them) of a pool written by save_pool
+    """
+    ret = []
+    num_rules = len(metagrammar.rules)
+    with open(filename, 'r') as f:
+        for line in f:
+            parts = line.split()
+            if not parts:
+                continue
+            # The rules may be followed by solver options, which are the only token with a =
+            n = num_rules + 1 if len(parts) > num_rules and "=" in parts[num_rules] else num_rules
+            ret.append(metagrammar.from_string(" ".join(parts[:n])))
+    return ret[:k] if k is not None else ret
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Solve SyGuS problems by racing learned metagrammars")
+    parser.add_argument("path", help="A .sl file or a directory of .sl files")
+    parser.add_argument("--pool", default="results/pool.txt", help="Pool written by main.py or genetic.py")
+    parser.add_argument("--rules", nargs="+", default=["rules/bitvec.json"],
+                        help="Rule specifications the pool was learned with")
+    parser.add_argument("-k", type=int, default=4, help="Number of candidates of the pool to race")
+    parser.add_argument("--timeout", type=int, default=60000, help="Timeout of each solver in ms")
+    parser.add_argument("--delivery", default="memfd", help="disk, memfd or tmpfs")
+    parser.add_argument("--no-original", action="store_true", help="Do not race the original grammar")
+    args = parser.parse_args()
+
+    m = Metagrammar(delivery=args.delivery, wall_limit=args.timeout / 1000 + 5)
+    for filename in args.rules:
+        m.add_rule(load_rule(filename))
+    portfolio = Portfolio(m, load_pool(m, args.pool, args.k), not args.no_original, args.timeout)
+
+    if os.path.isdir(args.path):
+        results = portfolio.solve_dir(os.path.join(args.path, ""))
+    else:
+        problem_dir, problem_name = os.path.split(args.path)
+        results = [portfolio.solve(os.path.join(problem_dir, ""), problem_name)]
+
+    for result in results:
+        print("[DEBUG] Problem: ", result["problem"], " | Winner: ", result["winner"],
+              " | Seconds: ", round(result["seconds"], 3))
+        print(result["result"])
@@ -0,0 +1,106 @@
+import random
+
+
+"""
+Solver options are searched along with the active rules: a candidate (a list of
+active_rules matrices, one per rule) may be followed by a dictionary of CVC5 options, e.g.
+{"sygus-enum": "fast", "sygus-repair-const": True}, that is passed to CVC5 when
+scoring it (see Metagrammar.get_solver_command).
+
+SOLVER_OPTIONS lists the values searched for each option, the first one being the default
+of CVC5. Boolean options are passed as --name or --no-name and every other option as
+--name=value. The random seed is deliberately not an option: searching over it would only
+tune candidates to the noise of the solver.
+"""
+
+
+SOLVER_OPTIONS = {
+    "sygus-enum": ["auto", "smart", "fast", "random", "var-agnostic"],
+    "sygus-eval-unfold": ["single-bool", "none", "single", "multi"],
+    "sygus-simple-sym-break": ["agg", "basic", "none"],
+    "sygus-fair": ["dt-size", "direct", "dt-height-bound", "dt-size-bound", "none"],
+    "sygus-repair-const": [False, True],
+}
+
+
+def default_options() -> dict:
+    """
+    Returns the default value (the first one) of every option
+    """
+    return {name: values[0] for name, values in SOLVER_OPTIONS.items()}
+
+
+def random_options(rng: random.Random = random) -> dict:
+    """
+    Returns a random value for every option
+    """
+    return {name: rng.choice(values) for name, values in SOLVER_OPTIONS.items()}
+
+
+def mutate_options(
+    options: dict,
+    rng: random.Random = random,
+    rate: float = 0.1,
+) -> dict:
+    """
+    Returns a copy of options where each option is set to a random value with probability
+    rate
+    """
+    ret = dict(options)
+    for name in ret:
+        if name in SOLVER_OPTIONS and rng.random() < rate:
+            ret[name] = rng.choice(SOLVER_OPTIONS[name])
+    return ret
+
+
+def cross_options(
+    options1: dict,
+    options2: dict,
+    rng: random.Random = random,
+    rate: float = 0.1,
+) -> dict:
+    """
+    Returns options where each option is taken from either options1 or options2, then
+    mutated with probability rate (see mutate_options)
+    """
+    ret = {name: rng.choice([value, options2.get(name, value)]) for name, value in options1.items()}
+    return mutate_options(ret, rng, rate)
+
+
+def options_to_args(options: dict) -> list:
+    """
+    Converts options to command line arguments of CVC5
+    """
+    ret = []
+    for name, value in options.items():
+        if value is True:
+            ret.append("--" + name)
+        elif value is False:
+            ret.append("--no-" + name)
+        else:
+            ret.append("--" + name + "=" + str(value))
+    return ret
+
+
+def options_to_string(options: dict) -> str:
+    """
+    Converts options to a single token e.g. sygus-enum=fast,sygus-repair-const=true
+    """
+    return ",".join(name + "=" + str(value).lower() if type(value) == bool else name + "=" + str(value)
+                    for name, value in options.items())
+
+
+def options_from_string(s: str) -> dict:
+    """
+    Parses options written by options_to_string
+    """
+    ret = {}
+    for item in s.split(","):
+        name, value = item.split("=", 1)
+        if value in ("true", "false"):
+            ret[name] = value == "true"
+        elif value.isdigit():
+            ret[name] = int(value)
+        else:
+            ret[name] = value
+    return ret
@@ -1,3 +1,4 @@
+from pathlib import Path
 from sexp_utils import *
 
 class SyGuSProblem:
@@ -21,6 +22,9 @@ class SyGuSProblem:
         self.constraints = []
         self.check_synth = []
 
+        # Static features of the problem, computed on first use (see get_features)
+        self.features = None
+
     
     def __str__(self):
         all_symbols = self.combine()
@@ -64,6 +68,17 @@ class SyGuSProblem:
         return self.symbols[:grammar_idx] + [self.synth_fun + self.synth_fun_name + [self.synth_fun_parameters] + self.synth_fun_ret_type + new_grammar] + self.symbols[grammar_idx+1:]
 
 
+    def export_with_new_grammar(
+        self,
+        new_grammar: list
+    ) -> str:
+        """
+        Returns the problem with its grammar replaced by new_grammar, ready to write
+        as a SyGuS problem (.sl file)
+        """
+        return export_sexp(self.create_with_new_grammar(new_grammar))
+
+
     """
     =============
     |GET Methods|
@@ -145,19 +160,100 @@ class SyGuSProblem:
         return ret
 
 
-    def get_variables(self):
+    def get_features(self) -> dict:
+        """
+        Gets static features of the problem from a full walk of the bodies of its
+        define-funs and of its constraints: the number of uses of each operator (the head
+        of every application, including calls of define-funs), the set of literal constants
+        (numerals and bit-vector literals, as returned by get_constants) and the number of
+        variables, parameters, define-funs and constraints as well as the maximum depth of
+        a term
+        """
+        if self.features is not None:
+            return self.features
+
+        operators = {}
+        constants = set()
+        max_depth = 0
+        # Terms left to walk with their depth
+        stack = []
+        for d in self.defines_and_declares:
+            if dumps(d[0]) == "define-fun":
+                stack += [(t, 1) for t in d[4:]]
+        stack += [(c[1], 1) for c in self.constraints if len(c) > 1]
+
+        while stack:
+            term, depth = stack.pop()
+            max_depth = max(max_depth, depth)
+            if type(term) != list:
+                s = dumps(term)
+                if type(term) in (int, float) or s.startswith("\\#"):
+                    constants.add(s)
+                continue
+            if not term:
+                continue
+
+            head = term[0]
+            if type(head) == list:
+                # Indexed operator e.g. ((_ extract 3 0) x)
+                name = dumps(head[1]) if len(head) > 1 and dumps(head[0]) == "_" else dumps(head)
+            else:
+                name = dumps(head)
+            if name == "_":
+                # Indexed literal e.g. (_ bv5 4)
+                constants.add(dumps(term))
+                continue
+            operators[name] = operators.get(name, 0) + 1
+
+            args = term[1:]
+            if name == "let" and args:
+                # Walk the bound terms and the body, not the names of the bindings
+                args = [b[1] for b in args[0] if type(b) == list and len(b) > 1] + args[1:]
+            elif name in ("forall", "exists") and args:
+                args = args[1:]
+            stack += [(a, depth + 1) for a in args]
+
+        self.features = {
+            "operators": operators,
+            "constants": constants,
+            "num_variables": len(self.get_variables()),
+            "num_parameters": len(self.synth_fun_parameters),
+            "num_define_funs": sum(1 for d in self.defines_and_declares if dumps(d[0]) == "define-fun"),
+            "num_constraints": len(self.constraints),
+            "max_depth": max_depth,
+        }
+        return self.features
+
+
+    def get_variables(self, sort = None):
         """
-        Get all the variables from the problem
+        Get all the variables from the problem, only the ones of sort if it is given
         """
         ret = set()
         for d in self.defines_and_declares:
             definition = d[0]
-            if dumps(definition) == "declare-var":
+            if dumps(definition) == "declare-var" and (sort is None or d[2] == sort):
                 var_name = d[1]
                 ret.add(dumps(var_name))
         return list(ret)
 
 
+    def get_logic(self) -> str:
+        """
+        Gets the logic of the problem as given by set-logic e.g. "BV"
+        """
+        if not self.logic:
+            return ""
+        return dumps(self.logic[0][1])
+
+
+    def get_parameter_sorts(self) -> list:
+        """
+        Gets the sorts of the parameters of the synthesis function
+        """
+        return [param[1] for param in self.synth_fun_parameters]
+
+
     """
     =========================================
     |READ/WRITE SyGuS Problem from/to a file|
@@ -174,8 +270,17 @@ class SyGuSProblem:
         Reads a SyGuS problem from a given a file.
         Returns a SyGuSProblem instance.
         """
-        SyGuS_sexp = get_sexp(src_dir + problem_name)
-        self.symbols = SyGuS_sexp
+        self.load_symbols(get_sexp(src_dir + problem_name))
+
+
+    def load_symbols(
+        self,
+        symbols: list,
+    ):
+        """
+        Loads the problem from the list of Symbols of a parsed SyGuS file
+        """
+        self.symbols = symbols
 
         for s in self.symbols:
             if starts_with_symbol(s, "set-logic"):
@@ -240,3 +345,167 @@ class SyGuSProblem:
         Path(dest_dir).mkdir(parents=True, exist_ok=True)
         with open(filename, 'w') as f:
             f.write(data)
+
+
+class LazySyGuSProblem(SyGuSProblem):
+    """
+    A SyGuSProblem that keeps the original text of the file along with the byte offsets of
+    its top-level commands. Only the commands needed to generate a grammar (set-logic, the
+    synth-fun header, define-funs and declare-vars) are parsed, and a problem with a new
+    grammar is exported by splicing the serialized grammar into the original text, so the
+    cost of an export depends on the size of the grammar rather than that of the file.
+    The rest of the problem is parsed on demand by the methods that need it.
+    """
+
+    def __init__(self, name: str):
+        super().__init__(name)
+
+        # Original contents of the file and (start, end) offsets of the top-level commands
+        self.text = b""
+        self.command_offsets = []
+
+        # Original text before and after the grammar of the synth-fun
+        self.prefix = ""
+        self.suffix = ""
+
+        # Whether the whole problem has been parsed into symbols
+        self.is_parsed = False
+
+
+    def create_with_new_grammar(
+        self, 
+        new_grammar: list
+    ) -> list:
+        self.parse_all()
+        return super().create_with_new_grammar(new_grammar)
+
+
+    def export_with_new_grammar(
+        self,
+        new_grammar: list
+    ) -> str:
+        """
+        Returns the original text of the problem with the grammar of the synth-fun replaced
+        by new_grammar
+        """
+        return self.export_with_grammar_string(export_grammar(new_grammar))
+
+
+    def export_with_grammar_string(
+        self,
+        grammar: str,
+    ) -> str:
+        """
+        Returns the original text of the problem with the grammar of the synth-fun replaced
+        by grammar, an already serialized grammar (see export_grammar)
+        """
+        return self.prefix + " " + grammar + self.suffix
+
+
+    def combine(self):
+        self.parse_all()
+        return super().combine()
+
+
+    def get_grammar(self):
+        self.parse_all()
+        return super().get_grammar()
+
+
+    def get_symbols(self):
+        self.parse_all()
+        return super().get_symbols()
+
+
+    def get_features(self) -> dict:
+        self.load_constraints()
+        return super().get_features()
+
+
+    def load_constraints(self):
+        """
+        Parses the constraints of the problem, which are skipped by read_sygus_problem
+        """
+        if self.is_parsed or self.constraints:
+            return
+        for start, end in self.command_offsets:
+            if get_sexp_head(self.text, start) == "constraint":
+                self.constraints.append(loads(self.text[start:end].decode()))
+
+
+    def parse_all(self):
+        """
+        Parses the whole problem, filling in the symbols, constraints and grammar that are
+        skipped by read_sygus_problem
+        """
+        if self.is_parsed:
+            return
+        self.logic = []
+        self.defines_and_declares = []
+        self.synth_fun = []
+        self.synth_fun_name = []
+        self.synth_fun_parameters = []
+        self.synth_fun_ret_type = []
+        self.synth_fun_terminals = []
+        self.synth_fun_non_terminals = []
+        self.constraints = []
+        self.check_synth = []
+        self.load_symbols(loads('(' + self.text.decode() + ')'))
+        self.is_parsed = True
+
+
+    def read_sygus_problem(
+        self,
+        src_dir: str,
+        problem_name: str,
+    ):
+        """
+        Reads the offsets of the commands of a SyGuS problem from a given file and parses
+        only the commands needed to generate a grammar.
+        """
+        try:
+            with open(src_dir + problem_name, 'rb') as f:
+                self.text = f.read()
+        except:
+            raise ValueError("Error with reading filename: ", src_dir + problem_name)
+
+        self.command_offsets = get_sexp_offsets(self.text)
+        for start, end in self.command_offsets:
+            head = get_sexp_head(self.text, start)
+            if head == "set-logic":
+                self.logic.append(loads(self.text[start:end].decode()))
+
+            elif head == "synth-fun":
+                header_end = self.get_synth_fun_header_end(start, end)
+                # Close the header so that it can be parsed on its own
+                header = loads(self.text[start:header_end].decode() + ")")
+                self.synth_fun = header[:1]
+                self.synth_fun_name = header[1:2]
+                self.synth_fun_parameters = header[2]
+                self.synth_fun_ret_type = header[3:4]
+                self.prefix = self.text[:header_end].decode()
+                # Note: end - 1 keeps the closing parenthesis of the synth-fun
+                self.suffix = self.text[end-1:].decode()
+
+            elif head == "define-fun" or head == "declare-var":
+                self.defines_and_declares.append(loads(self.text[start:end].decode()))
+
+
+    def get_synth_fun_header_end(
+        self,
+        start: int,
+        end: int,
+    ) -> int:
+        """
+        Gets the offset right after the return type of the synth-fun command spanning
+        start to end, i.e. where its grammar begins
+        """
+        # The first list inside the synth-fun is the parameters
+        inner = get_sexp_offsets(self.text, start + 1, end - 1)
+        params_end = inner[0][1]
+
+        # The return type is either the next list, e.g. (_ BitVec 4), or a symbol e.g. Int
+        ret_start = SEXP_WHITESPACE.match(self.text, params_end).end()
+        if self.text[ret_start:ret_start+1] == b'(':
+            return inner[1][1]
+        return SEXP_ATOM.match(self.text, ret_start).end()
@@ -0,0 +1,152 @@
+from collections import deque
+from metagrammar import Metagrammar
+from optimizer import Optimizer
+from solveroptions import mutate_options
+
+
+class TabuSearch(Optimizer):
+    """
+    A TabuSearch is a hill climber with memory. It never proposes a candidate that was
+    already scored (or is isomorphic to one, by canonical hash), and the entries (rule,
+    nonterminal, subrule) flipped by its last moves are tabu: neighbors that flip them again
+    are only drawn with probability aspiration_rate, and only moved to if they beat the
+    best candidate so far (aspiration). Unlike the HillClimber, it moves to the best
+    admissible neighbor even if it is worse than the current one, and after restart_after
+    batches without improving the best candidate it restarts from a perturbed copy of the
+    best candidate with an empty tabu list.
+
+    The best candidate so far is best (see Optimizer) and the candidate the search moves
+    from is current.
+    """
+
+    def __init__(
+        self,
+        metagrammar: Metagrammar,
+        problem_dir: str,
+        problems: list,
+        num_flips: int = 1,
+        tabu_tenure: int = 20,
+        aspiration_rate: float = 0.25,
+        restart_after: int = 10,
+        restart_flips: int = 10,
+        max_tries: int = 100,
+        **kwargs,
+    ):
+        """
+        Creates a TabuSearch starting from the current active rules of metagrammar. The
+        tabu list holds the entries flipped by the last tabu_tenure flips, and max_tries is
+        the number of attempts at drawing an unvisited neighbor before giving up. See
+        Optimizer for the other arguments.
+        """
+        super().__init__(metagrammar, problem_dir, problems, **kwargs)
+        self.num_flips = num_flips
+        self.tabu_tenure = tabu_tenure
+        self.aspiration_rate = aspiration_rate
+        self.restart_after = restart_after
+        self.restart_flips = restart_flips
+        self.max_tries = max_tries
+
+        self.current = self.copy_candidate(metagrammar.get_candidate())
+        self.tabu = deque(maxlen=tabu_tenure)
+        self.steps_since_improvement = 0
+
+        # Flipped entries of the candidates of the last ask by canonical hash (none for
+        # the starting candidate, which is scored first)
+        self.flips = {metagrammar.canonical_hash(self.current): []}
+
+
+    def tabu_neighbor(
+        self,
+        candidate: list,
+        allow_tabu: bool,
+        proposed: set,
+    ) -> (list, list, str):
+        """
+        Draws a neighbor of candidate with num_flips distinct entries flipped, none of them
+        tabu unless allow_tabu is set, that was never scored and is not in proposed (the
+        canonical hashes of the neighbors already drawn in this step). Returns the neighbor,
+        its flipped entries as (rule, nonterminal, subrule) and its canonical hash, or None
+        if no such neighbor was found in max_tries attempts.
+        """
+        active_rules, options = self.metagrammar.split_candidate(candidate)
+        positions = [(k, i, j) for k, a in enumerate(active_rules) for i in range(len(a)) for j in range(len(a[i]))]
+        allowed = positions if allow_tabu else [p for p in positions if p not in self.tabu]
+        if len(allowed) < self.num_flips:
+            return None
+
+        for _ in range(self.max_tries):
+            ret = self.copy_candidate(candidate)
+            if options is not None:
+                ret[-1] = mutate_options(options, self.rng, self.option_rate)
+            flips = self.rng.sample(allowed, self.num_flips)
+            for k, i, j in flips:
+                ret[k][i][j] = not ret[k][i][j]
+            h = self.metagrammar.canonical_hash(ret)
+            if h not in self.seen and h not in proposed:
+                return ret, flips, h
+        return None
+
+
+    def get_proposals(self, n: int) -> list:
+        """
+        Draws up to n unvisited neighbors of current (see tabu_neighbor)
+        """
+        ret = []
+        proposed = set()
+        for _ in range(n):
+            proposal = self.tabu_neighbor(self.current, self.rng.random() < self.aspiration_rate, proposed)
+            if proposal is not None:
+                ret.append(proposal)
+                proposed.add(proposal[2])
+        return ret
+
+
+    def ask(self, n: int) -> list:
+        if self.best is None:
+            return [self.current]
+        proposals = self.get_proposals(n)
+        if not proposals:
+            # Every nearby state was visited
+            self.restart()
+            proposals = self.get_proposals(n)
+        self.flips = {h: flips for _, flips, h in proposals}
+        return [p[0] for p in proposals]
+
+
+    def tell(
+        self,
+        candidates: list,
+        results: list,
+    ):
+        best = self.best
+        super().tell(candidates, results)
+
+        move = None
+        for candidate, result in zip(candidates, results):
+            flips = self.flips.get(self.metagrammar.canonical_hash(candidate), [])
+            is_tabu = any(f in self.tabu for f in flips)
+            is_better = best is None or (result[0] < best[1] and result[1] <= best[2])
+            if is_tabu and not is_better:
+                continue
+            if move is None or self.get_key(result) < self.get_key(move[2]):
+                move = (candidate, flips, result)
+
+        if move is not None:
+            self.current = move[0]
+            self.tabu.extend(move[1])
+
+        improved = self.best is not best
+        self.steps_since_improvement = 0 if improved else self.steps_since_improvement + 1
+        if self.steps_since_improvement >= self.restart_after:
+            self.restart()
+
+
+    def restart(self):
+        """
+        Moves to the best candidate with restart_flips random entries flipped and clears
+        the tabu list
+        """
+        print("[DEBUG] Restart")
+        self.current = self.neighbor(self.best[0], self.restart_flips)
+        self.tabu.clear()
+        self.steps_since_improvement = 0
@@ -0,0 +1,163 @@
+import os
+import queue
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+
+"""
+=====================================================
+|Noise-controlled timing of solvers run in parallel|
+=====================================================
+"""
+
+
+def get_physical_cores() -> list:
+    """
+    Gets one logical CPU per physical core among the CPUs this process may run on, so that
+    two pinned solvers never share a core through hyper-threading
+    """
+    ret = []
+    seen = set()
+    for cpu in sorted(os.sched_getaffinity(0)):
+        topology = "/sys/devices/system/cpu/cpu" + str(cpu) + "/topology/"
+        try:
+            with open(topology + "physical_package_id") as f:
+                package = f.read().strip()
+            with open(topology + "core_id") as f:
+                core = f.read().strip()
+            key = (package, core)
+        except OSError:
+            # No topology information, assume every CPU is a physical core
+            key = cpu
+        if key not in seen:
+            seen.add(key)
+            ret.append(cpu)
+    return ret
+
+
+class CorePool:
+    """
+    A CorePool hands out dedicated cores to solver runs. A run holds its core until it is
+    done, so no more runs than cores happen at once and each run has a core to itself.
+    The free cores are only known to the process the pool was created in, unless the pool
+    is shared (see share) before starting the processes that use it.
+    """
+
+    def __init__(self, cores: list = None):
+        """
+        Creates a pool of cores (by default one per physical core, see get_physical_cores)
+        """
+        if cores is None:
+            cores = get_physical_cores()
+        self.cores = list(cores)
+        self.is_shared = False
+        self.free = queue.Queue()
+        for core in self.cores:
+            self.free.put(core)
+
+
+    def __getstate__(self):
+        """
+        Pickles only the list of cores, the copy starts with every core free
+        """
+        return {"cores": self.cores}
+
+
+    def __setstate__(self, state):
+        self.__init__(state["cores"])
+
+
+    def __len__(self):
+        return len(self.cores)
+
+
+    def share(self, ctx):
+        """
+        Moves the free cores to a queue of the multiprocessing context ctx, so that the
+        processes forked from this one afterwards (e.g. the islands of island.py) take
+        their cores from the same pool. Cores in use are given back to the shared queue.
+        """
+        if self.is_shared:
+            return
+        self.is_shared = True
+        free = ctx.Queue()
+        while True:
+            try:
+                free.put(self.free.get_nowait())
+            except queue.Empty:
+                break
+        self.free = free
+
+
+    @contextmanager
+    def acquire(self):
+        """
+        Waits for a free core and yields it, giving it back at the end of the with block
+        """
+        core = self.free.get()
+        try:
+            yield core
+        finally:
+            self.free.put(core)
+
+
+def summarize_times(times: list) -> dict:
+    """
+    Returns the mean, standard deviation, coefficient of variation, min and max of times
+    """
+    mean = statistics.mean(times)
+    stdev = statistics.stdev(times) if len(times) > 1 else 0.0
+    return {
+        "mean": mean,
+        "stdev": stdev,
+        "cv": stdev / mean if mean else 0.0,
+        "min": min(times),
+        "max": max(times),
+    }
+
+
+def calibrate(
+    metagrammar,
+    problem_dir: str,
+    problem_name: str,
+    repetitions: int = 10,
+    num_workers: int = None,
+) -> dict:
+    """
+    Runs a reference problem (with its original grammar) repetitions times on its own and
+    then repetitions times per worker with num_workers solvers at once (by default as many
+    as cores in the metagrammar's core pool, or CPUs). Returns the summary (see
+    summarize_times) of the times reported by CVC5 and of the measured CPU times of both,
+    along with the ratio between the parallel and serial mean times. A high coefficient of
+    variation means that score differences of that relative size are noise, and a ratio
+    well above 1 means that running solvers in parallel inflates their times. CVC5 runs
+    with its default options.
+    """
+    metagrammar = metagrammar.copy_with_solver_options(None)
+    if num_workers is None:
+        num_workers = len(metagrammar.core_pool) if metagrammar.core_pool else os.cpu_count()
+
+    def run(_):
+        return metagrammar.run_solver(problem_dir, problem_name)
+
+    ret = {}
+    start = time.perf_counter()
+    serial = [run(i) for i in range(repetitions)]
+    ret["serial_seconds"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=num_workers) as executor:
+        parallel = list(executor.map(run, range(repetitions * num_workers)))
+    ret["parallel_seconds"] = time.perf_counter() - start
+
+    for name, records in [("serial", serial), ("parallel", parallel)]:
+        ret[name] = {
+            "time_to_solve": summarize_times([metagrammar.get_record_time(r) for r in records]),
+            "cpu_time": summarize_times([r["cpu_time"] for r in records]),
+        }
+    serial_mean = ret["serial"]["time_to_solve"]["mean"]
+    ret["inflation"] = ret["parallel"]["time_to_solve"]["mean"] / serial_mean if serial_mean else 0.0
+    ret["num_workers"] = num_workers
+    return ret